@@ -1,5 +1,74 @@
 import anthropic
-from typing import List, Optional, Dict, Any
+import asyncio
+import contextvars
+import httpx
+import json
+import re
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import List, Optional, Dict, Any, AsyncIterator, Sequence, Set, Tuple
+from search_tools import replay_sources, source_scope
+
+# Shared clients keyed by API key so every AIGenerator reuses one connection pool
+_CLIENTS: Dict[str, anthropic.Anthropic] = {}
+_CLIENTS_LOCK = threading.Lock()
+
+
+def _get_client(api_key: str) -> anthropic.Anthropic:
+    """Return the shared Anthropic client for an API key, creating it on first use"""
+    client = _CLIENTS.get(api_key)
+    if client is not None:
+        return client
+    
+    with _CLIENTS_LOCK:
+        if api_key not in _CLIENTS:
+            http_client = httpx.Client(
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+                timeout=httpx.Timeout(60.0, connect=5.0)
+            )
+            _CLIENTS[api_key] = anthropic.Anthropic(api_key=api_key, http_client=http_client)
+        return _CLIENTS[api_key]
+
+
+def _build_async_client(api_key: str) -> anthropic.AsyncAnthropic:
+    """Create an AsyncAnthropic client; its connection pool belongs to the loop that uses it"""
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+        timeout=httpx.Timeout(60.0, connect=5.0)
+    )
+    return anthropic.AsyncAnthropic(api_key=api_key, http_client=http_client)
+
+# Matches <answer id=N>...</answer> blocks in batch-prompted responses (id may be quoted)
+_ANSWER_PATTERN = re.compile(r'<answer id=["\']?(\d+)["\']?>(.*?)</answer>', re.DOTALL)
+
+SystemBlocks = Tuple[Dict[str, Any], ...]
+
+
+@lru_cache(maxsize=128)
+def _build_system(system_prompt: str, conversation_history: Optional[str]) -> SystemBlocks:
+    """Build (and memoize) system blocks; callers must treat the result as read-only"""
+    system_blocks: List[Dict[str, Any]] = [{
+        "type": "text",
+        "text": system_prompt,
+        "cache_control": {"type": "ephemeral"}
+    }]
+    
+    # Second breakpoint: tool rounds within a turn resend identical history, so it
+    # caches too; canonical whitespace keeps the block byte-stable across callers
+    if conversation_history:
+        history_block = "\n".join(line.rstrip() for line in conversation_history.strip().splitlines())
+        system_blocks.append({
+            "type": "text",
+            "text": f"Previous conversation:\n{history_block}",
+            "cache_control": {"type": "ephemeral"}
+        })
+    
+    return tuple(system_blocks)
+
 
 class AIGenerator:
     """Handles interactions with Anthropic's Claude API for generating responses"""
@@ -41,9 +110,22 @@ All responses must be:
 Provide only the direct answer to what was asked.
 """
     
-    def __init__(self, api_key: str, model: str):
-        self.client = anthropic.Anthropic(api_key=api_key)
+    # Beta that shrinks tool_use output tokens; only Claude 3.7 Sonnet needs it opted in
+    TOKEN_EFFICIENT_TOOLS_BETA = "token-efficient-tools-2025-02-19"
+    
+    # Upper bound on memoized responses when cache_deterministic is enabled
+    RESPONSE_CACHE_SIZE = 256
+    
+    def __init__(self, api_key: str, model: str, cache_deterministic: bool = False):
+        self.api_key = api_key
+        self.client = _get_client(api_key)
+        self._async_client: Optional[anthropic.AsyncAnthropic] = None  # Explicit override
+        # One async client per event loop: httpx pools can't be shared across loops, so a
+        # second asyncio.run() or a reloaded worker gets a fresh client
+        self._loop_clients: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
         self.model = model
+        self.token_efficient_tools = model.startswith("claude-3-7")
+        self._tools: Optional[Tuple[Dict[str, Any], ...]] = None
         
         # Pre-build base API parameters
         self.base_params = {
@@ -51,6 +133,45 @@ Provide only the direct answer to what was asked.
             "temperature": 0,
             "max_tokens": 800
         }
+        
+        # Opt-in LRU of final answers; only valid because temperature is 0
+        self.cache_deterministic = cache_deterministic
+        self._response_cache: OrderedDict = OrderedDict()
+        self._response_cache_lock = threading.Lock()
+    
+    @property
+    def async_client(self) -> anthropic.AsyncAnthropic:
+        """Async client for the running event loop, created lazily so sync-only callers never build it"""
+        if self._async_client is not None:
+            return self._async_client
+        
+        loop = asyncio.get_running_loop()
+        client = self._loop_clients.get(loop)
+        if client is None:
+            client = self._loop_clients[loop] = _build_async_client(self.api_key)
+        return client
+    
+    @async_client.setter
+    def async_client(self, client: anthropic.AsyncAnthropic):
+        self._async_client = client
+    
+    async def aclose(self):
+        """Close the running loop's async client, e.g. on application shutdown"""
+        client = self._loop_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.close()
+    
+    def set_tools(self, tools: Optional[List]):
+        """
+        Pin tool definitions used whenever a call passes tools=None.
+        
+        The cache breakpoint is applied once here, so every call sends a
+        byte-identical tool prefix and keeps hitting the prompt cache.
+        
+        Args:
+            tools: Tool definitions to pin, or None to clear
+        """
+        self._tools = tuple(self._with_tool_cache_control(tools)) if tools else None
     
     def generate_response(self, query: str,
                          conversation_history: Optional[str] = None,
@@ -60,52 +181,69 @@ Provide only the direct answer to what was asked.
         """
         Generate AI response with support for sequential tool calls (up to max_rounds).
         
+        With cache_deterministic enabled, identical requests are answered from an
+        in-process LRU without calling Claude or running tools (so tool side
+        effects such as tracked sources are not refreshed on a hit).
+        
         Args:
             query: The user's question or request
             conversation_history: Previous messages for context
-            tools: Available tools the AI can use
+            tools: Available tools the AI can use (None uses tools pinned via set_tools)
             tool_manager: Manager to execute tools
             max_rounds: Maximum number of tool execution rounds (default: 2)
             
         Returns:
             Generated response as string
         """
+        cache_key = self._response_cache_key(query, conversation_history, tools, max_rounds)
+        cached = self._get_cached_response(cache_key)
+        if cached is not None:
+            return cached
         
-        # Build system content efficiently - avoid string ops when possible
-        system_content = (
-            f"{self.SYSTEM_PROMPT}\n\nPrevious conversation:\n{conversation_history}"
-            if conversation_history 
-            else self.SYSTEM_PROMPT
-        )
+        response = self._generate_response(query, conversation_history, tools, tool_manager, max_rounds)
+        self._store_cached_response(cache_key, response)
+        return response
+    
+    def _generate_response(self, query: str,
+                           conversation_history: Optional[str] = None,
+                           tools: Optional[List] = None,
+                           tool_manager=None,
+                           max_rounds: int = 2) -> str:
+        """Run the tool loop for generate_response, bypassing the response cache"""
+        # Build system content as cacheable blocks - static prompt first
+        system_content = self._build_system_content(conversation_history)
+        tools = self._resolve_tools(tools)
         
         # Initialize conversation state
         messages = [{"role": "user", "content": query}]
+        
+        # Fast path: without tools and a manager to run them, one plain call suffices
+        if not tools or not tool_manager:
+            return self._make_final_call_without_tools(messages, system_content)
         current_round = 0
+        seen_tool_calls: Set[Tuple[str, str]] = set()
         
         # Main execution loop
         while current_round < max_rounds:
             # Prepare API call parameters
-            api_params = {
-                **self.base_params,
-                "messages": messages.copy(),
-                "system": system_content
-            }
-            
-            # Add tools if available
-            if tools:
-                api_params["tools"] = tools
-                api_params["tool_choice"] = {"type": "auto"}
+            api_params = self._build_round_params(messages, system_content, tools)
             
             # Get response from Claude
             response = self._make_api_call(api_params)
             
             # Check if Claude wants to use tools
             if response.stop_reason == "tool_use" and tool_manager and tools:
+                repeated = self._is_repeated_tool_round(response, seen_tool_calls)
+                
                 # Execute tools and update conversation state
                 messages = self._execute_tools_and_update_conversation(
                     response, messages, tool_manager
                 )
                 current_round += 1
+                
+                # Claude is re-asking for results it already has - force synthesis
+                if repeated:
+                    break
                 # Continue loop for next round
             else:
                 # No tool use - return final response
@@ -114,15 +252,384 @@ Provide only the direct answer to what was asked.
         # Reached max rounds - make final call without tools
         return self._make_final_call_without_tools(messages, system_content)
     
+    async def generate_response_async(self, query: str,
+                                      conversation_history: Optional[str] = None,
+                                      tools: Optional[List] = None,
+                                      tool_manager=None,
+                                      max_rounds: int = 2) -> str:
+        """
+        Async variant of generate_response using AsyncAnthropic.
+        
+        Tool calls still run synchronously, so they are offloaded to worker
+        threads to keep the event loop free. Shares the response cache with
+        generate_response.
+        
+        Args:
+            query: The user's question or request
+            conversation_history: Previous messages for context
+            tools: Available tools the AI can use (None uses tools pinned via set_tools)
+            tool_manager: Manager to execute tools
+            max_rounds: Maximum number of tool execution rounds (default: 2)
+            
+        Returns:
+            Generated response as string
+        """
+        cache_key = self._response_cache_key(query, conversation_history, tools, max_rounds)
+        cached = self._get_cached_response(cache_key)
+        if cached is not None:
+            return cached
+        
+        response = await self._generate_response_async(
+            query, conversation_history, tools, tool_manager, max_rounds
+        )
+        self._store_cached_response(cache_key, response)
+        return response
+    
+    async def _generate_response_async(self, query: str,
+                                       conversation_history: Optional[str] = None,
+                                       tools: Optional[List] = None,
+                                       tool_manager=None,
+                                       max_rounds: int = 2) -> str:
+        """Run the async tool loop, bypassing the response cache"""
+        system_content = self._build_system_content(conversation_history)
+        tools = self._resolve_tools(tools)
+        
+        messages = [{"role": "user", "content": query}]
+        
+        if not tools or not tool_manager:
+            response = await self._make_api_call_async({
+                **self.base_params,
+                "messages": messages,
+                "system": system_content
+            })
+            return response.content[0].text
+        
+        current_round = 0
+        seen_tool_calls: Set[Tuple[str, str]] = set()
+        
+        while current_round < max_rounds:
+            api_params = self._build_round_params(messages, system_content, tools)
+            response = await self._make_api_call_async(api_params)
+            
+            if response.stop_reason == "tool_use" and tool_manager and tools:
+                repeated = self._is_repeated_tool_round(response, seen_tool_calls)
+                messages = await self._execute_tools_and_update_conversation_async(
+                    response, messages, tool_manager
+                )
+                current_round += 1
+                if repeated:
+                    break
+            else:
+                return response.content[0].text
+        
+        final_params = {
+            **self.base_params,
+            "messages": messages,
+            "system": system_content
+        }
+        final_response = await self._make_api_call_async(final_params)
+        return final_response.content[0].text
+    
+    async def generate_response_stream(self, query: str,
+                                       conversation_history: Optional[str] = None,
+                                       tools: Optional[List] = None,
+                                       tool_manager=None,
+                                       max_rounds: int = 2) -> AsyncIterator[Dict[str, str]]:
+        """
+        Stream the AI response as it is generated while running the same tool loop.
+        
+        Text deltas are forwarded as soon as they arrive. A round's text is only known
+        to be preamble to a tool call once a tool_use block starts; at that point a
+        discard event tells the consumer to drop all text received so far (all of it
+        belongs to tool rounds), and the rest of that round is held back.
+        
+        Args:
+            query: The user's question or request
+            conversation_history: Previous messages for context
+            tools: Available tools the AI can use (None uses tools pinned via set_tools)
+            tool_manager: Manager to execute tools
+            max_rounds: Maximum number of tool execution rounds (default: 2)
+            
+        Yields:
+            {"type": "text", "text": ...} deltas in order, and {"type": "discard"} events
+        """
+        system_content = self._build_system_content(conversation_history)
+        tools = self._resolve_tools(tools)
+        
+        messages = [{"role": "user", "content": query}]
+        current_round = 0
+        seen_tool_calls: Set[Tuple[str, str]] = set()
+        
+        can_use_tools = bool(tool_manager and tools)
+        
+        while current_round < max_rounds:
+            api_params = self._build_round_params(messages, system_content, tools)
+            round_text: List[str] = []
+            calling_tools = False
+            async with self._open_stream(api_params) as stream:
+                async for event in stream:
+                    if event.type == "text":
+                        round_text.append(event.text)
+                        if not calling_tools:
+                            yield {"type": "text", "text": event.text}
+                    elif (event.type == "content_block_start" and event.content_block.type == "tool_use"
+                          and can_use_tools and not calling_tools):
+                        calling_tools = True
+                        if round_text:
+                            yield {"type": "discard"}
+                response = await stream.get_final_message()
+            
+            if response.stop_reason == "tool_use" and can_use_tools:
+                repeated = self._is_repeated_tool_round(response, seen_tool_calls)
+                messages = await self._execute_tools_and_update_conversation_async(
+                    response, messages, tool_manager
+                )
+                current_round += 1
+                if repeated:
+                    break
+            else:
+                # A tool block started but the round still ended as the answer (e.g. at
+                # max_tokens), so the consumer gets this round's text back in full
+                if calling_tools:
+                    for text in round_text:
+                        yield {"type": "text", "text": text}
+                return
+        
+        final_params = {
+            **self.base_params,
+            "messages": messages,
+            "system": system_content
+        }
+        async with self._open_stream(final_params) as stream:
+            async for event in stream:
+                if event.type == "text":
+                    yield {"type": "text", "text": event.text}
+    
+    def _open_stream(self, api_params: Dict[str, Any]):
+        """Open an async message stream, routing beta requests to the beta endpoint"""
+        betas = api_params.pop("_betas", None)
+        if betas:
+            return self.async_client.beta.messages.stream(**api_params, betas=betas)
+        return self.async_client.messages.stream(**api_params)
+    
+    def generate_response_batch(self, queries: List[str],
+                                conversation_history: Optional[str] = None,
+                                poll_interval: float = 1.0,
+                                max_poll_interval: float = 60.0) -> List[str]:
+        """
+        Generate responses for many independent queries via the Message Batches API.
+        
+        Batches are billed at half price but complete asynchronously, so this is
+        meant for non-interactive work (evals, bulk summarization). Tools are not
+        offered since a batch request cannot run the multi-round tool loop.
+        
+        Args:
+            queries: Independent user questions
+            conversation_history: Optional shared context for every query
+            poll_interval: Initial seconds between status polls
+            max_poll_interval: Upper bound for the exponential poll backoff
+            
+        Returns:
+            Response texts in the same order as queries
+        """
+        if not queries:
+            return []
+        
+        system_content = self._build_system_content(conversation_history)
+        batch = self.client.messages.batches.create(requests=[
+            {
+                "custom_id": f"q{i}",
+                "params": {
+                    **self.base_params,
+                    "system": system_content,
+                    "messages": [{"role": "user", "content": query}]
+                }
+            }
+            for i, query in enumerate(queries)
+        ])
+        
+        # Poll with exponential backoff until the batch finishes processing
+        delay = poll_interval
+        while batch.processing_status != "ended":
+            time.sleep(delay)
+            delay = min(delay * 2, max_poll_interval)
+            batch = self.client.messages.batches.retrieve(batch.id)
+        
+        # Results stream back in arbitrary order; custom_id maps them to queries
+        responses = [""] * len(queries)
+        for entry in self.client.messages.batches.results(batch.id):
+            index = int(entry.custom_id[1:])
+            if entry.result.type == "succeeded":
+                responses[index] = entry.result.message.content[0].text
+            else:
+                responses[index] = f"Error generating response: batch request {entry.result.type}"
+        
+        return responses
+    
+    def generate_response_multi(self, queries: List[str],
+                                conversation_history: Optional[str] = None,
+                                max_tokens_cap: int = 8192) -> List[str]:
+        """
+        Answer several independent questions with a single batch-prompted API call.
+        
+        Args:
+            queries: Independent user questions
+            conversation_history: Optional shared context for every question
+            max_tokens_cap: Upper bound on the output budget for the combined answer
+            
+        Returns:
+            Answers in the same order as queries; missing answers are empty strings
+        """
+        if not queries:
+            return []
+        
+        numbered = "\n".join(f"{i}. {query}" for i, query in enumerate(queries, start=1))
+        prompt = (
+            "Answer each question independently.\n"
+            f"{numbered}\n"
+            "Format: <answers><answer id=N>...</answer></answers> with N matching the question number."
+        )
+        
+        # Scale the output budget with the number of questions
+        max_tokens = min(self.base_params["max_tokens"] * len(queries), max_tokens_cap)
+        response = self._make_api_call({
+            **self.base_params,
+            "max_tokens": max_tokens,
+            "messages": [{"role": "user", "content": prompt}],
+            "system": self._build_system_content(conversation_history)
+        })
+        
+        answers = [""] * len(queries)
+        for answer_id, text in _ANSWER_PATTERN.findall(response.content[0].text):
+            index = int(answer_id) - 1
+            if 0 <= index < len(queries):
+                answers[index] = text.strip()
+        
+        return answers
+    
+    def _build_round_params(self, messages: List, system_content: SystemBlocks,
+                            tools: Optional[List]) -> Dict[str, Any]:
+        """Build API parameters for one tool-enabled round"""
+        # The SDK only reads messages, so the live list is passed without copying
+        api_params = {
+            **self.base_params,
+            "messages": messages,
+            "system": system_content
+        }
+        
+        # Add tools if available
+        if tools:
+            api_params["tools"] = tools
+            api_params["tool_choice"] = {"type": "auto"}
+            if self.token_efficient_tools:
+                api_params["_betas"] = [self.TOKEN_EFFICIENT_TOOLS_BETA]
+        
+        return api_params
+    
+    def _response_cache_key(self, query: str, conversation_history: Optional[str],
+                            tools: Optional[List], max_rounds: int) -> Optional[Tuple]:
+        """Build the response-cache key, or None when caching does not apply"""
+        if not self.cache_deterministic or self.base_params["temperature"] != 0:
+            return None
+        
+        resolved_tools = self._tools if tools is None else tools
+        tool_names = tuple(tool["name"] for tool in resolved_tools or ())
+        return (
+            self.base_params["model"],
+            self.base_params["max_tokens"],
+            query,
+            conversation_history or "",
+            tool_names,
+            max_rounds
+        )
+    
+    def _get_cached_response(self, cache_key: Optional[Tuple]) -> Optional[str]:
+        """Return a cached response and mark it most recently used"""
+        if cache_key is None:
+            return None
+        
+        with self._response_cache_lock:
+            response = self._response_cache.get(cache_key)
+            if response is not None:
+                self._response_cache.move_to_end(cache_key)
+            return response
+    
+    def _store_cached_response(self, cache_key: Optional[Tuple], response: str):
+        """Store a response, evicting the least recently used entry when full"""
+        if cache_key is None:
+            return
+        
+        with self._response_cache_lock:
+            self._response_cache[cache_key] = response
+            self._response_cache.move_to_end(cache_key)
+            if len(self._response_cache) > self.RESPONSE_CACHE_SIZE:
+                self._response_cache.popitem(last=False)
+    
+    def _is_repeated_tool_round(self, response, seen_tool_calls: Set[Tuple[str, str]]) -> bool:
+        """
+        Check whether every tool call in a response was already made in an earlier round.
+        
+        Args:
+            response: Claude's response containing tool use blocks
+            seen_tool_calls: Fingerprints from earlier rounds, updated in place
+            
+        Returns:
+            True if the round only repeats earlier (name, input) tool calls
+        """
+        fingerprints = {
+            (block.name, json.dumps(block.input, sort_keys=True))
+            for block in response.content
+            if block.type == "tool_use"
+        }
+        repeated = bool(fingerprints) and fingerprints <= seen_tool_calls
+        seen_tool_calls |= fingerprints
+        return repeated
+    
+    def _build_system_content(self, conversation_history: Optional[str] = None) -> SystemBlocks:
+        """
+        Build system prompt blocks with a prompt-cache breakpoint on the static prompt.
+        
+        Args:
+            conversation_history: Previous messages for context
+            
+        Returns:
+            Tuple of system text blocks; history block only when history exists
+        """
+        return _build_system(self.SYSTEM_PROMPT, conversation_history)
+    
+    def _resolve_tools(self, tools: Optional[List]) -> Optional[Sequence[Dict[str, Any]]]:
+        """Use explicit tools (with cache breakpoint) or fall back to the pinned set"""
+        if tools is None:
+            return self._tools
+        return self._with_tool_cache_control(tools)
+    
+    def _with_tool_cache_control(self, tools: Optional[List]) -> Optional[List]:
+        """Return tools with a cache breakpoint on the last definition (caller's list untouched)"""
+        if not tools:
+            return tools
+        
+        last_tool = {**tools[-1], "cache_control": {"type": "ephemeral"}}
+        return [*tools[:-1], last_tool]
+    
     def _make_api_call(self, api_params: Dict[str, Any]):
-        """Make API call with error handling"""
+        """Make API call with error handling, routing beta requests to the beta endpoint"""
+        betas = api_params.pop("_betas", None)
         try:
+            if betas:
+                return self.client.beta.messages.create(**api_params, betas=betas)
             return self.client.messages.create(**api_params)
         except Exception as e:
             # Log error and re-raise for now
             # Could implement retry logic here in future
             raise e
     
+    async def _make_api_call_async(self, api_params: Dict[str, Any]):
+        """Async counterpart of _make_api_call"""
+        betas = api_params.pop("_betas", None)
+        if betas:
+            return await self.async_client.beta.messages.create(**api_params, betas=betas)
+        return await self.async_client.messages.create(**api_params)
+    
     def _execute_tools_and_update_conversation(self, response, messages: List, tool_manager) -> List:
         """
         Execute all tool calls from response and update conversation history.
@@ -138,29 +645,22 @@ Provide only the direct answer to what was asked.
         # Add Claude's tool use response to conversation
         messages.append({"role": "assistant", "content": response.content})
         
-        # Execute all tool calls and collect results
-        tool_results = []
-        for content_block in response.content:
-            if content_block.type == "tool_use":
-                try:
-                    tool_result = tool_manager.execute_tool(
-                        content_block.name, 
-                        **content_block.input
-                    )
-                    
-                    tool_results.append({
-                        "type": "tool_result",
-                        "tool_use_id": content_block.id,
-                        "content": tool_result
-                    })
-                except Exception as e:
-                    # Handle tool execution errors gracefully
-                    tool_results.append({
-                        "type": "tool_result",
-                        "tool_use_id": content_block.id,
-                        "content": f"Error executing tool: {str(e)}",
-                        "is_error": True
-                    })
+        tool_blocks = [block for block in response.content if block.type == "tool_use"]
+        
+        # Run parallel tool calls concurrently; a single call skips the pool overhead
+        if len(tool_blocks) > 1:
+            with ThreadPoolExecutor(max_workers=len(tool_blocks)) as executor:
+                # Each worker runs in a copy of this context so request-scoped state
+                # (e.g. search_tools.source_scope) is visible to the tools
+                futures = [
+                    executor.submit(contextvars.copy_context().run,
+                                    self._execute_tool_in_own_scope, block, tool_manager)
+                    for block in tool_blocks
+                ]
+                # Collect in block order so results line up with tool_use ids
+                tool_results = self._merge_scoped_results([future.result() for future in futures])
+        else:
+            tool_results = [self._execute_single_tool(block, tool_manager) for block in tool_blocks]
         
         # Add tool results as single message
         if tool_results:
@@ -168,13 +668,66 @@ Provide only the direct answer to what was asked.
         
         return messages
     
-    def _make_final_call_without_tools(self, messages: List, system_content: str) -> str:
+    async def _execute_tools_and_update_conversation_async(self, response, messages: List,
+                                                           tool_manager) -> List:
+        """Async counterpart of _execute_tools_and_update_conversation"""
+        messages.append({"role": "assistant", "content": response.content})
+        
+        tool_blocks = [block for block in response.content if block.type == "tool_use"]
+        # gather preserves argument order, so results line up with tool_use ids
+        tool_results = self._merge_scoped_results(await asyncio.gather(*[
+            asyncio.to_thread(self._execute_tool_in_own_scope, block, tool_manager)
+            for block in tool_blocks
+        ]))
+        
+        if tool_results:
+            messages.append({"role": "user", "content": tool_results})
+        
+        return messages
+    
+    def _execute_tool_in_own_scope(self, content_block, tool_manager):
+        """Execute one tool_use block concurrently with others, returning (tool_result, sources it recorded)"""
+        with source_scope() as recorded:
+            return self._execute_single_tool(content_block, tool_manager), recorded
+    
+    @staticmethod
+    def _merge_scoped_results(outcomes) -> List[Dict[str, Any]]:
+        """Replay each call's sources in block order, so the last block wins as in a serial run"""
+        tool_results = []
+        for tool_result, recorded in outcomes:
+            replay_sources(recorded)
+            tool_results.append(tool_result)
+        return tool_results
+    
+    def _execute_single_tool(self, content_block, tool_manager) -> Dict[str, Any]:
+        """Execute one tool_use block and return its tool_result block"""
+        try:
+            tool_result = tool_manager.execute_tool(
+                content_block.name, 
+                **content_block.input
+            )
+            
+            return {
+                "type": "tool_result",
+                "tool_use_id": content_block.id,
+                "content": tool_result
+            }
+        except Exception as e:
+            # Handle tool execution errors gracefully
+            return {
+                "type": "tool_result",
+                "tool_use_id": content_block.id,
+                "content": f"Error executing tool: {str(e)}",
+                "is_error": True
+            }
+    
+    def _make_final_call_without_tools(self, messages: List, system_content: SystemBlocks) -> str:
         """
         Make final API call without tools when max rounds reached.
         
         Args:
             messages: Complete conversation history
-            system_content: System prompt content
+            system_content: System prompt blocks (with cache breakpoint)
             
         Returns:
             Final response text
@@ -187,52 +740,4 @@ Provide only the direct answer to what was asked.
         }
         
         final_response = self._make_api_call(final_params)
-        return final_response.content[0].text
-    
-    def _handle_tool_execution(self, initial_response, base_params: Dict[str, Any], tool_manager):
-        """
-        Handle execution of tool calls and get follow-up response.
-        
-        Args:
-            initial_response: The response containing tool use requests
-            base_params: Base API parameters
-            tool_manager: Manager to execute tools
-            
-        Returns:
-            Final response text after tool execution
-        """
-        # Start with existing messages
-        messages = base_params["messages"].copy()
-        
-        # Add AI's tool use response
-        messages.append({"role": "assistant", "content": initial_response.content})
-        
-        # Execute all tool calls and collect results
-        tool_results = []
-        for content_block in initial_response.content:
-            if content_block.type == "tool_use":
-                tool_result = tool_manager.execute_tool(
-                    content_block.name, 
-                    **content_block.input
-                )
-                
-                tool_results.append({
-                    "type": "tool_result",
-                    "tool_use_id": content_block.id,
-                    "content": tool_result
-                })
-        
-        # Add tool results as single message
-        if tool_results:
-            messages.append({"role": "user", "content": tool_results})
-        
-        # Prepare final API call without tools
-        final_params = {
-            **self.base_params,
-            "messages": messages,
-            "system": base_params["system"]
-        }
-        
-        # Get final response
-        final_response = self.client.messages.create(**final_params)
         return final_response.content[0].text
\ No newline at end of file
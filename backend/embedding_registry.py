@@ -0,0 +1,33 @@
+import threading
+from typing import Any, Dict
+
+import chromadb
+
+# One embedding function per model name, shared by every VectorStore in the process
+_MODELS: Dict[str, Any] = {}
+_lock = threading.Lock()
+
+
+def get_embedding_fn(model_name: str):
+    """Return the shared SentenceTransformer embedding function for model_name, loading it once"""
+    embedding_fn = _MODELS.get(model_name)
+    if embedding_fn is not None:
+        return embedding_fn
+    
+    with _lock:
+        # Another thread may have loaded it while we waited
+        if model_name not in _MODELS:
+            # Imported here so importing this module doesn't pull in torch
+            import torch
+            
+            _MODELS[model_name] = chromadb.utils.embedding_functions.SentenceTransformerEmbeddingFunction(
+                model_name=model_name,
+                device="cuda" if torch.cuda.is_available() else "cpu"
+            )
+        return _MODELS[model_name]
+
+
+def clear():
+    """Forget every loaded model, e.g. between tests that patch the embedding function"""
+    with _lock:
+        _MODELS.clear()
@@ -0,0 +1,52 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+class QueryCache:
+    """Thread-safe LRU cache whose entries also expire after a fixed TTL"""
+    
+    def __init__(self, max_size: int = 2000, ttl_seconds: float = 300):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.RLock()
+        self._hits = 0
+        self._misses = 0
+    
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value for key and mark it most recently used, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self._misses += 1
+                return None
+            
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return value
+    
+    def put(self, key: Hashable, value: Any):
+        """Store a value, evicting the least recently used entry when full"""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+    
+    def invalidate(self):
+        """Drop every entry, e.g. after the underlying collections change"""
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self) -> Dict[str, int]:
+        """Current size and hit/miss counters"""
+        with self._lock:
+            return {"size": len(self._entries), "hits": self._hits, "misses": self._misses}
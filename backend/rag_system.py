@@ -1,10 +1,10 @@
-from typing import List, Tuple, Optional, Dict
+from typing import List, Tuple, Optional, Dict, Any, AsyncIterator
 import os
 from document_processor import DocumentProcessor
 from vector_store import VectorStore
 from ai_generator import AIGenerator
 from session_manager import SessionManager
-from search_tools import ToolManager, CourseSearchTool, CourseOutlineTool
+from search_tools import ToolManager, CourseSearchTool, CourseOutlineTool, source_scope
 from models import Course, Lesson, CourseChunk
 
 class RAGSystem:
@@ -25,6 +25,9 @@ class RAGSystem:
         self.outline_tool = CourseOutlineTool(self.vector_store)
         self.tool_manager.register_tool(self.search_tool)
         self.tool_manager.register_tool(self.outline_tool)
+        
+        # Pin tool definitions once so every query sends an identical, cacheable schema
+        self.ai_generator.set_tools(self.tool_manager.get_tool_definitions())
     
     def add_course_document(self, file_path: str) -> Tuple[Course, int]:
         """
@@ -120,19 +123,20 @@ class RAGSystem:
         if session_id:
             history = self.session_manager.get_conversation_history(session_id)
         
-        # Generate response using AI with tools
-        response = self.ai_generator.generate_response(
-            query=prompt,
-            conversation_history=history,
-            tools=self.tool_manager.get_tool_definitions(),
-            tool_manager=self.tool_manager
-        )
-        
-        # Get sources from the search tool
-        sources = self.tool_manager.get_last_sources()
-
-        # Reset sources after retrieving them
-        self.tool_manager.reset_sources()
+        # Sources recorded by tools stay private to this request
+        with source_scope():
+            # Generate response using AI with tools
+            response = self.ai_generator.generate_response(
+                query=prompt,
+                conversation_history=history,
+                tool_manager=self.tool_manager
+            )
+            
+            # Get sources from the search tool
+            sources = self.tool_manager.get_last_sources()
+            
+            # Reset sources after retrieving them
+            self.tool_manager.reset_sources()
         
         # Update conversation history
         if session_id:
@@ -141,6 +145,79 @@ class RAGSystem:
         # Return response with sources from tool searches
         return response, sources
     
+    async def query_async(self, query: str, session_id: Optional[str] = None) -> Tuple[str, List[str]]:
+        """
+        Async variant of query that awaits the AI generator instead of blocking.
+        
+        Args:
+            query: User's question
+            session_id: Optional session ID for conversation context
+            
+        Returns:
+            Tuple of (response, sources list)
+        """
+        prompt = f"""Answer this question about course materials: {query}"""
+        
+        history = None
+        if session_id:
+            history = self.session_manager.get_conversation_history(session_id)
+        
+        # Concurrent requests interleave on the event loop, so sources must be per-request
+        with source_scope():
+            response = await self.ai_generator.generate_response_async(
+                query=prompt,
+                conversation_history=history,
+                tool_manager=self.tool_manager
+            )
+            
+            sources = self.tool_manager.get_last_sources()
+            self.tool_manager.reset_sources()
+        
+        if session_id:
+            self.session_manager.add_exchange(session_id, query, response)
+        
+        return response, sources
+    
+    async def query_stream(self, query: str, session_id: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Process a user query and stream the response as it is generated.
+        
+        Args:
+            query: User's question
+            session_id: Optional session ID for conversation context
+            
+        Yields:
+            {"type": "text", "text": ...} events, {"type": "discard"} events that drop the
+            text received so far (tool-call preamble), then one {"type": "sources", ...}
+        """
+        prompt = f"""Answer this question about course materials: {query}"""
+        
+        history = None
+        if session_id:
+            history = self.session_manager.get_conversation_history(session_id)
+        
+        response_parts = []
+        with source_scope():
+            async for event in self.ai_generator.generate_response_stream(
+                query=prompt,
+                conversation_history=history,
+                tool_manager=self.tool_manager
+            ):
+                if event["type"] == "discard":
+                    response_parts.clear()
+                else:
+                    response_parts.append(event["text"])
+                yield event
+            
+            sources = self.tool_manager.get_last_sources()
+            self.tool_manager.reset_sources()
+        
+        # History only records the exchange once the full response is known
+        if session_id:
+            self.session_manager.add_exchange(session_id, query, "".join(response_parts))
+        
+        yield {"type": "sources", "sources": sources}
+    
     def get_course_analytics(self) -> Dict:
         """Get analytics about the course catalog"""
         return {
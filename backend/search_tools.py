@@ -1,7 +1,39 @@
-from typing import Dict, Any, Optional, Protocol
+from typing import Dict, Any, List, Optional, Protocol
 from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from contextvars import ContextVar
 from vector_store import VectorStore, SearchResults
 
+# Per-request sources, keyed by tool; None outside source_scope(). The dict is shared
+# by reference, so tools running in worker threads (which get a context copy) still
+# record into the request that started them.
+_request_sources: ContextVar[Optional[Dict["Tool", List[str]]]] = ContextVar("request_sources", default=None)
+
+
+@contextmanager
+def source_scope():
+    """Keep sources recorded by tools inside the block private to the current request
+    
+    Yields the dict the block records into, so concurrent tool calls can each run in
+    their own scope and be merged back in a fixed order with replay_sources().
+    """
+    recorded: Dict["Tool", List[str]] = {}
+    token = _request_sources.set(recorded)
+    try:
+        yield recorded
+    finally:
+        try:
+            _request_sources.reset(token)
+        except ValueError:
+            # An async generator finalized from another context; its request is over anyway
+            pass
+
+
+def replay_sources(recorded: Dict["Tool", List[str]]):
+    """Record sources captured in another scope into the current one, as if set here"""
+    for tool, sources in recorded.items():
+        tool.last_sources = sources
+
 
 class Tool(ABC):
     """Abstract base class for all tools"""
@@ -22,7 +54,23 @@ class CourseSearchTool(Tool):
     
     def __init__(self, vector_store: VectorStore):
         self.store = vector_store
-        self.last_sources = []  # Track sources from last search
+        self._last_sources: List[str] = []  # Used outside source_scope()
+    
+    @property
+    def last_sources(self) -> List[str]:
+        """Sources from the last search in the current request"""
+        scope = _request_sources.get()
+        if scope is None:
+            return self._last_sources
+        return scope.get(self, [])
+    
+    @last_sources.setter
+    def last_sources(self, sources: List[str]):
+        scope = _request_sources.get()
+        if scope is None:
+            self._last_sources = sources
+        else:
+            scope[self] = sources
     
     def get_tool_definition(self) -> Dict[str, Any]:
         """Return Anthropic tool definition for this tool"""
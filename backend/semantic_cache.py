@@ -0,0 +1,88 @@
+import threading
+from typing import Any, Dict, Hashable, List, Optional
+
+import numpy as np
+
+
+class SemanticCache:
+    """FIFO cache of search results matched by cosine similarity of int8-quantized query embeddings"""
+    
+    def __init__(self, threshold: float = 0.97, max_size: int = 1024):
+        self.threshold = threshold
+        self.max_size = max_size
+        # int8 fingerprints with a per-row float32 scale; (max_size, dim), allocated on first add
+        self._fp_matrix: Optional[np.ndarray] = None
+        self._scales = np.zeros(max_size, dtype=np.float32)
+        self._filter_ids = np.full(max_size, -1, dtype=np.int64)
+        self._filter_index: Dict[Hashable, int] = {}
+        self._results: List[Any] = [None] * max_size
+        self._count = 0
+        self._next = 0
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _normalize(embedding) -> Optional[np.ndarray]:
+        """Unit-length float32 copy of an embedding, or None for a zero vector"""
+        vector = np.asarray(embedding, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            return None
+        return vector / norm
+    
+    @staticmethod
+    def _quantize(vector: np.ndarray):
+        """Symmetric int8 quantization of a unit vector, returning (codes, scale)"""
+        scale = float(np.abs(vector).max()) / 127.0
+        return np.round(vector / scale).astype(np.int8), np.float32(scale)
+    
+    def lookup(self, embedding, filters: Hashable) -> Optional[Any]:
+        """Return the cached result most similar to embedding under the same filters"""
+        vector = self._normalize(embedding)
+        with self._lock:
+            filter_id = self._filter_index.get(filters)
+            if vector is None or filter_id is None or self._fp_matrix is None:
+                return None
+            if vector.shape[0] != self._fp_matrix.shape[1]:
+                return None
+            
+            codes, scale = self._quantize(vector)
+            # Integer dot products rescaled back to cosine similarity
+            sims = (self._fp_matrix[:self._count] @ codes.astype(np.int32)).astype(np.float32)
+            sims *= self._scales[:self._count] * scale
+            sims[self._filter_ids[:self._count] != filter_id] = -np.inf
+            best = int(np.argmax(sims))
+            if sims[best] >= self.threshold:
+                return self._results[best]
+            return None
+    
+    def add(self, embedding, filters: Hashable, result: Any):
+        """Store a result, overwriting the oldest entry when full"""
+        vector = self._normalize(embedding)
+        if vector is None:
+            return
+        
+        with self._lock:
+            if self._fp_matrix is None or vector.shape[0] != self._fp_matrix.shape[1]:
+                self._reset(vector.shape[0])
+            
+            slot = self._next
+            self._fp_matrix[slot], self._scales[slot] = self._quantize(vector)
+            self._filter_ids[slot] = self._filter_index.setdefault(filters, len(self._filter_index))
+            self._results[slot] = result
+            self._next = (slot + 1) % self.max_size
+            self._count = min(self._count + 1, self.max_size)
+    
+    def invalidate(self):
+        """Drop every entry, e.g. after the underlying collections change"""
+        with self._lock:
+            self._reset(None)
+    
+    def _reset(self, dim: Optional[int]):
+        """Clear all entries; callers hold the lock"""
+        self._fp_matrix = None if dim is None else np.zeros((self.max_size, dim), dtype=np.int8)
+        self._scales.fill(0)
+        self._filter_ids.fill(-1)
+        self._filter_index.clear()
+        self._results = [None] * self.max_size
+        self._count = 0
+        self._next = 0
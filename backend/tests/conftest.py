@@ -1,91 +1,91 @@
 import pytest
-import tempfile
-import shutil
-from unittest.mock import Mock, MagicMock, patch
-from typing import List, Dict, Any
-import asyncio
+from unittest.mock import Mock
+from typing import List, Dict, Any, Optional
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import lru_cache
+from types import SimpleNamespace
 from fastapi.testclient import TestClient
-from httpx import AsyncClient
+from filelock import FileLock
 
-# Add backend to path for imports
-import sys
-import os
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import chromadb
+import json
+from chromadb.config import Settings
 
 from models import Course, Lesson, CourseChunk
 from vector_store import VectorStore, SearchResults
+from tests.stubs import HashEmbeddingFunction, StubVectorStore
+import search_tools  # noqa: F401 - loaded with conftest so each xdist worker imports it once, up front
 from config import Config
 
-@pytest.fixture
-def sample_course():
-    """Create a sample course for testing"""
-    lessons = [
+# Sample course data is built once at import; fixtures hand out the same objects
+_SAMPLE_COURSE_TITLE = "Python Programming Basics"
+
+_SAMPLE_COURSE = Course(
+    title=_SAMPLE_COURSE_TITLE,
+    course_link="https://example.com/course",
+    instructor="John Doe",
+    lessons=[
         Lesson(lesson_number=1, title="Introduction to Python", lesson_link="https://example.com/lesson1"),
         Lesson(lesson_number=2, title="Variables and Data Types", lesson_link="https://example.com/lesson2"),
         Lesson(lesson_number=3, title="Control Flow", lesson_link="https://example.com/lesson3")
     ]
-    
-    return Course(
-        title="Python Programming Basics",
-        course_link="https://example.com/course",
-        instructor="John Doe",
-        lessons=lessons
-    )
+)
 
-@pytest.fixture
-def sample_course_chunks(sample_course):
-    """Create sample course chunks for testing"""
-    chunks = []
-    
+_SAMPLE_CHUNKS = (
     # Lesson 1 chunks
-    chunks.append(CourseChunk(
+    CourseChunk(
         content="Course Python Programming Basics Lesson 1 content: This is an introduction to Python programming. Python is a high-level programming language.",
-        course_title=sample_course.title,
+        course_title=_SAMPLE_COURSE_TITLE,
         lesson_number=1,
         chunk_index=0
-    ))
-    
-    chunks.append(CourseChunk(
+    ),
+    CourseChunk(
         content="Python is known for its simplicity and readability. It's used in web development, data science, and automation.",
-        course_title=sample_course.title,
+        course_title=_SAMPLE_COURSE_TITLE,
         lesson_number=1,
         chunk_index=1
-    ))
-    
+    ),
     # Lesson 2 chunks
-    chunks.append(CourseChunk(
+    CourseChunk(
         content="Course Python Programming Basics Lesson 2 content: Variables in Python store data values. Python has several data types including integers, strings, and lists.",
-        course_title=sample_course.title,
+        course_title=_SAMPLE_COURSE_TITLE,
         lesson_number=2,
         chunk_index=2
-    ))
-    
-    return chunks
+    ),
+)
 
-@pytest.fixture
-def mock_vector_store():
-    """Create a mock vector store for testing"""
-    with patch('chromadb.utils.embedding_functions.SentenceTransformerEmbeddingFunction'):
-        mock_store = Mock(spec=VectorStore)
-        
-        # Default successful search result
-        mock_store.search.return_value = SearchResults(
-            documents=["Sample document content about Python programming"],
-            metadata=[{"course_title": "Python Programming Basics", "lesson_number": 1}],
-            distances=[0.1],
-            error=None
-        )
-        
-        # Mock other methods
-        mock_store.get_lesson_link.return_value = "https://example.com/lesson1"
-        mock_store._resolve_course_name.return_value = "Python Programming Basics"
-        
-        # Mock course catalog for outline tool tests
-        mock_store.course_catalog = Mock()
-        
-        return mock_store
+@pytest.fixture(scope="session")
+def sample_course():
+    """Create a sample course for testing"""
+    return _SAMPLE_COURSE
+
+@pytest.fixture(scope="session")
+def sample_course_chunks():
+    """Create sample course chunks for testing"""
+    return list(_SAMPLE_CHUNKS)
 
 @pytest.fixture
+def fake_vector_store():
+    """Create a stub vector store for unit tests that only check call args"""
+    return StubVectorStore()
+
+@pytest.fixture(scope="session")
+def in_memory_vector_store(sample_course, sample_course_chunks):
+    """Real VectorStore on an in-process ChromaDB client, loaded with the sample course"""
+    store = VectorStore(
+        ":memory:",
+        "unused-model",
+        max_results=3,
+        client=chromadb.EphemeralClient(settings=Settings(anonymized_telemetry=False)),
+        embedding_function=HashEmbeddingFunction()
+    )
+    store.clear_all_data()
+    store.add_course_metadata(sample_course)
+    store.add_course_content(sample_course_chunks)
+    return store
+
+@pytest.fixture(scope="session")
 def empty_search_results():
     """Create empty search results for testing"""
     return SearchResults(
@@ -95,12 +95,12 @@ def empty_search_results():
         error=None
     )
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def error_search_results():
     """Create error search results for testing"""
     return SearchResults.empty("Search error: ChromaDB connection failed")
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def successful_search_results():
     """Create successful search results for testing"""
     return SearchResults(
@@ -115,45 +115,87 @@ def successful_search_results():
         distances=[0.1, 0.2]
     )
 
-@pytest.fixture
-def mock_anthropic_client():
-    """Create a mock Anthropic client for testing"""
-    mock_client = Mock()
-    
-    # Mock a successful response with tool use
-    mock_response = Mock()
-    mock_response.stop_reason = "tool_use"
-    
-    # Mock content with tool use
-    mock_tool_content = Mock()
-    mock_tool_content.type = "tool_use"
-    mock_tool_content.name = "search_course_content"
-    mock_tool_content.id = "tool_123"
-    mock_tool_content.input = {"query": "test query"}
+@dataclass
+class FakeBlock:
+    """Lightweight stand-in for an Anthropic content block"""
+    type: str
+    name: str = ""
+    id: str = ""
+    input: Optional[Dict[str, Any]] = None
+    text: str = ""
+
+@dataclass
+class FakeResponse:
+    """Lightweight stand-in for an Anthropic Messages API response"""
+    stop_reason: str
+    content: List[FakeBlock]
+
+class FakeMessages:
+    """Plain-attribute replacement for `client.messages` that records create() kwargs"""
     
-    mock_response.content = [mock_tool_content]
+    def __init__(self, response: FakeResponse):
+        self.response = response
+        self.calls: List[Dict[str, Any]] = []
     
-    mock_client.messages.create.return_value = mock_response
+    def create(self, **kwargs) -> FakeResponse:
+        self.calls.append(kwargs)
+        return self.response
+
+class FakeAnthropicClient:
+    """Minimal Anthropic client stub exposing only `messages.create`"""
     
-    return mock_client
+    def __init__(self, response: FakeResponse):
+        self.messages = FakeMessages(response)
+
+@lru_cache(maxsize=None)
+def _build_response(
+    stop_reason: str,
+    text: Optional[str] = None,
+    tool_name: Optional[str] = None,
+    tool_id: Optional[str] = None,
+    tool_input: tuple = ()
+) -> SimpleNamespace:
+    """Build (once per distinct argument set) a read-only Anthropic-style response"""
+    content = []
+    if text is not None:
+        content.append(SimpleNamespace(type="text", text=text))
+    if tool_name is not None:
+        content.append(SimpleNamespace(
+            type="tool_use",
+            name=tool_name,
+            id=tool_id,
+            input=dict(tool_input)
+        ))
+    return SimpleNamespace(stop_reason=stop_reason, content=content)
+
+@pytest.fixture(scope="module")
+def response_factory():
+    """Cached builder for response payloads; tool_input is a tuple of (key, value) pairs"""
+    return _build_response
+
+@pytest.fixture
+def mock_anthropic_client():
+    """Create a stub Anthropic client whose response requests a tool call"""
+    return FakeAnthropicClient(FakeResponse(
+        stop_reason="tool_use",
+        content=[FakeBlock(
+            type="tool_use",
+            name="search_course_content",
+            id="tool_123",
+            input={"query": "test query"}
+        )]
+    ))
 
 @pytest.fixture
 def mock_anthropic_text_response():
-    """Create a mock Anthropic client that returns text responses"""
-    mock_client = Mock()
-    
-    # Mock a text response
-    mock_response = Mock()
-    mock_response.stop_reason = "end_turn"
-    
-    mock_text_content = Mock()
-    mock_text_content.text = "This is a sample AI response about Python programming."
-    
-    mock_response.content = [mock_text_content]
-    
-    mock_client.messages.create.return_value = mock_response
-    
-    return mock_client
+    """Create a stub Anthropic client that returns text responses"""
+    return FakeAnthropicClient(FakeResponse(
+        stop_reason="end_turn",
+        content=[FakeBlock(
+            type="text",
+            text="This is a sample AI response about Python programming."
+        )]
+    ))
 
 @pytest.fixture
 def test_config():
@@ -168,11 +210,9 @@ def test_config():
     return config
 
 @pytest.fixture
-def temp_chroma_db():
+def temp_chroma_db(tmp_path):
     """Create a temporary ChromaDB instance for integration tests"""
-    temp_dir = tempfile.mkdtemp()
-    yield temp_dir
-    shutil.rmtree(temp_dir)
+    return str(tmp_path)
 
 @pytest.fixture
 def mock_tool_manager():
@@ -202,7 +242,7 @@ def mock_tool_manager():
     
     return mock_manager
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def sample_query_scenarios():
     """Provide various query scenarios for testing"""
     return {
@@ -217,42 +257,96 @@ def sample_query_scenarios():
 
 # API Testing Fixtures
 
-@pytest.fixture
-def test_app():
+def build_mock_rag_defaults() -> Dict[str, Any]:
+    """Canned mock RAG responses, kept JSON-serializable so xdist workers can share them"""
+    return {
+        "query": ["Test response", ["Test source"]],
+        "course_analytics": {
+            "total_courses": 2,
+            "course_titles": ["Python Programming Basics", "Advanced Python"]
+        },
+        "session_id": "test-session-123"
+    }
+
+class Recorder:
+    """Slot-based stand-in for a mocked method on the hot API paths
+    
+    Records the positional args of the last call in `last`. `side_effect` follows
+    Mock semantics for exceptions and iterables; otherwise `return_value` is returned.
+    """
+    __slots__ = ("last", "return_value", "side_effect")
+    
+    def __init__(self, return_value: Any = None):
+        self.last: Optional[tuple] = None
+        self.return_value = return_value
+        self.side_effect: Any = None
+    
+    def __call__(self, *args, **kwargs):
+        self.last = args
+        effect = self.side_effect
+        if effect is None:
+            return self.return_value
+        if isinstance(effect, BaseException) or (
+            isinstance(effect, type) and issubclass(effect, BaseException)
+        ):
+            raise effect
+        if not hasattr(effect, "__next__"):
+            effect = self.side_effect = iter(effect)
+        return next(effect)
+
+def configure_mock_rag(mock_rag: Mock, mock_state: Optional[Dict[str, Any]] = None):
+    """Apply default return values to the shared mock RAG system"""
+    mock_state = mock_state or build_mock_rag_defaults()
+    mock_rag.query = Recorder(tuple(mock_state["query"]))
+    
+    # Endpoint awaits query_async; delegate to query so tests configure one recorder
+    async def mock_query_async(query, session_id):
+        return mock_rag.query(query, session_id)
+    
+    async def mock_query_stream(query, session_id):
+        answer, sources = mock_rag.query(query, session_id)
+        for word in answer.split(" "):
+            yield {"type": "text", "text": word + " "}
+        yield {"type": "sources", "sources": sources}
+    
+    mock_rag.query_async = mock_query_async
+    mock_rag.query_stream = mock_query_stream
+    mock_rag.get_course_analytics = Recorder(mock_state["course_analytics"])
+    mock_rag.session_manager.create_session = Recorder(mock_state["session_id"])
+    mock_rag.session_manager.clear_session = Recorder()
+
+def create_test_app(with_middleware: bool = False, mock_state: Optional[Dict[str, Any]] = None):
     """Create a test FastAPI application without static file mounting"""
     from fastapi import FastAPI, HTTPException
     from fastapi.middleware.cors import CORSMiddleware
     from fastapi.middleware.trustedhost import TrustedHostMiddleware
+    from fastapi.responses import StreamingResponse
     from pydantic import BaseModel
+    import json
     from typing import List, Optional
     
     # Create test app
     app = FastAPI(title="Course Materials RAG System - Test", root_path="")
     
-    # Add middleware
-    app.add_middleware(
-        TrustedHostMiddleware,
-        allowed_hosts=["*"]
-    )
-    
-    app.add_middleware(
-        CORSMiddleware,
-        allow_origins=["*"],
-        allow_credentials=True,
-        allow_methods=["*"],
-        allow_headers=["*"],
-        expose_headers=["*"],
-    )
+    # Production middleware only gates nothing with "*", so most tests skip it
+    if with_middleware:
+        app.add_middleware(
+            TrustedHostMiddleware,
+            allowed_hosts=["*"]
+        )
+        
+        app.add_middleware(
+            CORSMiddleware,
+            allow_origins=["*"],
+            allow_credentials=True,
+            allow_methods=["*"],
+            allow_headers=["*"],
+            expose_headers=["*"],
+        )
     
     # Mock RAG system for testing
     mock_rag = Mock()
-    mock_rag.query.return_value = ("Test response", ["Test source"])
-    mock_rag.get_course_analytics.return_value = {
-        "total_courses": 2,
-        "course_titles": ["Python Programming Basics", "Advanced Python"]
-    }
-    mock_rag.session_manager.create_session.return_value = "test-session-123"
-    mock_rag.session_manager.clear_session.return_value = None
+    configure_mock_rag(mock_rag, mock_state)
     
     # Request/Response models
     class QueryRequest(BaseModel):
@@ -273,7 +367,7 @@ def test_app():
     async def query_documents(request: QueryRequest):
         try:
             session_id = request.session_id or mock_rag.session_manager.create_session()
-            answer, sources = mock_rag.query(request.query, session_id)
+            answer, sources = await mock_rag.query_async(request.query, session_id)
             return QueryResponse(
                 answer=answer,
                 sources=sources,
@@ -282,6 +376,21 @@ def test_app():
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
 
+    @app.post("/api/query/stream")
+    async def query_documents_stream(request: QueryRequest):
+        session_id = request.session_id or mock_rag.session_manager.create_session()
+        
+        async def event_stream():
+            try:
+                async for event in mock_rag.query_stream(request.query, session_id):
+                    if event["type"] == "sources":
+                        event = {"type": "done", "sources": event["sources"], "session_id": session_id}
+                    yield f"data: {json.dumps(event)}\n\n"
+            except Exception as e:
+                yield f"data: {json.dumps({'type': 'error', 'detail': str(e)})}\n\n"
+        
+        return StreamingResponse(event_stream(), media_type="text/event-stream")
+
     @app.get("/api/courses", response_model=CourseStats)
     async def get_course_stats():
         try:
@@ -310,18 +419,73 @@ def test_app():
     
     return app
 
-@pytest.fixture
+@pytest.fixture(scope="session")
+def shared_mock_state(tmp_path_factory, worker_id):
+    """Build the mock RAG defaults once per test run and share them across xdist workers"""
+    if worker_id == "master":
+        return build_mock_rag_defaults()
+    
+    # All workers share the parent of their per-worker base temp directories
+    state_file = tmp_path_factory.getbasetemp().parent / "mock_rag_state.json"
+    with FileLock(str(state_file) + ".lock"):
+        if state_file.is_file():
+            return json.loads(state_file.read_text())
+        mock_state = build_mock_rag_defaults()
+        state_file.write_text(json.dumps(mock_state))
+        return mock_state
+
+@pytest.fixture(scope="session")
+def test_app(shared_mock_state):
+    """Test FastAPI application without middleware"""
+    return create_test_app(mock_state=shared_mock_state)
+
+@pytest.fixture(scope="session")
+def test_app_with_cors(shared_mock_state):
+    """Test FastAPI application with the production TrustedHost and CORS middleware"""
+    return create_test_app(with_middleware=True, mock_state=shared_mock_state)
+
+@pytest.fixture(scope="session")
+def cors_test_client(test_app_with_cors):
+    """Test client for CORS-specific tests"""
+    with TestClient(test_app_with_cors) as client:
+        yield client
+
+@pytest.fixture(scope="session")
 def test_client(test_app):
-    """Create a test client for API testing"""
-    return TestClient(test_app)
+    """Create one test client shared by every API test; lifespan runs once per session"""
+    # Starlette's TestClient is httpx-based and dispatches in-process, no sockets involved
+    with TestClient(test_app, raise_server_exceptions=True) as client:
+        yield client
 
 @pytest.fixture
-async def async_test_client(test_app):
-    """Create an async test client for API testing"""
-    async with AsyncClient(app=test_app, base_url="http://test") as client:
-        yield client
+def reset_mock_rag(test_app, shared_mock_state):
+    """Restore the shared mock RAG system to its defaults before each test"""
+    mock_rag = test_app.state.mock_rag
+    mock_rag.reset_mock(return_value=True, side_effect=True)
+    configure_mock_rag(mock_rag, shared_mock_state)
+    return mock_rag
 
 @pytest.fixture
+def raise_on(test_client):
+    """Context manager that makes a mock RAG attribute raise, restoring it on exit
+    
+    Usage: `with raise_on("session_manager.clear_session", Exception("boom")): ...`
+    """
+    @contextmanager
+    def _raise(path: str, exc: Exception):
+        target = test_client.app.state.mock_rag
+        for name in path.split("."):
+            target = getattr(target, name)
+        previous = target.side_effect
+        target.side_effect = exc
+        try:
+            yield target
+        finally:
+            target.side_effect = previous
+    
+    return _raise
+
+@pytest.fixture(scope="session")
 def api_query_request():
     """Sample API query request data"""
     return {
@@ -329,33 +493,9 @@ def api_query_request():
         "session_id": "test-session-123"
     }
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def api_query_request_no_session():
     """Sample API query request without session ID"""
     return {
         "query": "What is Python programming?"
     }
-
-@pytest.fixture
-def expected_query_response():
-    """Expected API query response"""
-    return {
-        "answer": "Test response",
-        "sources": ["Test source"],
-        "session_id": "test-session-123"
-    }
-
-@pytest.fixture
-def expected_course_stats():
-    """Expected course statistics response"""
-    return {
-        "total_courses": 2,
-        "course_titles": ["Python Programming Basics", "Advanced Python"]
-    }
-
-@pytest.fixture
-def event_loop():
-    """Create an event loop for async tests"""
-    loop = asyncio.new_event_loop()
-    yield loop
-    loop.close()
\ No newline at end of file
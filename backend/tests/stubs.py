@@ -0,0 +1,102 @@
+"""Hand-rolled test doubles shared by conftest fixtures and individual test modules"""
+import hashlib
+import re
+from typing import Any, Dict
+
+import numpy as np
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings
+
+from vector_store import SearchResults
+
+class StubCourseCatalog:
+    """Stand-in for the course catalog collection, recording get() calls"""
+    __slots__ = ("get_return", "get_calls")
+    
+    def __init__(self):
+        self.get_return = None
+        self.get_calls = []
+    
+    def get(self, **kwargs):
+        self.get_calls.append(kwargs)
+        return self.get_return
+
+class StubVectorStore:
+    """Hand-rolled vector store stand-in that records calls without Mock's bookkeeping
+    
+    Slotted, so a misspelled attribute in a test raises instead of silently creating a new one.
+    """
+    __slots__ = ("search_return", "lesson_link", "resolved_course_name", "calls", "resolve_calls", "course_catalog")
+    
+    def __init__(self):
+        self.reset()
+    
+    def reset(self) -> "StubVectorStore":
+        """Restore the default successful-search behavior and drop recorded calls"""
+        # Default successful search result
+        self.search_return = SearchResults(
+            documents=["Sample document content about Python programming"],
+            metadata=[{"course_title": "Python Programming Basics", "lesson_number": 1}],
+            distances=[0.1],
+            error=None
+        )
+        self.lesson_link = "https://example.com/lesson1"
+        self.resolved_course_name = "Python Programming Basics"
+        self.calls = []
+        self.resolve_calls = []
+        
+        # Course catalog for outline tool tests
+        self.course_catalog = StubCourseCatalog()
+        return self
+    
+    def search(self, **kwargs):
+        self.calls.append(kwargs)
+        return self.search_return
+    
+    def get_lesson_link(self, course_title, lesson_number):
+        return self.lesson_link
+    
+    def _resolve_course_name(self, course_name):
+        self.resolve_calls.append(course_name)
+        return self.resolved_course_name
+
+class HashEmbeddingFunction(EmbeddingFunction[Documents]):
+    """Deterministic bag-of-words hashing embedder so tests never load a model"""
+    
+    DIMENSIONS = 64
+    
+    def __init__(self):
+        pass
+    
+    @staticmethod
+    def name() -> str:
+        return "test-hash"
+    
+    def get_config(self) -> Dict[str, Any]:
+        return {}
+    
+    @staticmethod
+    def build_from_config(config: Dict[str, Any]) -> "HashEmbeddingFunction":
+        return HashEmbeddingFunction()
+    
+    def __call__(self, input: Documents) -> Embeddings:
+        embeddings = []
+        for text in input:
+            vector = np.zeros(self.DIMENSIONS, dtype=np.float32)
+            for word in re.findall(r"\w+", text.lower()):
+                digest = hashlib.md5(word.encode("utf-8")).digest()
+                vector[int.from_bytes(digest[:4], "little") % self.DIMENSIONS] += 1.0
+            embeddings.append(vector)
+        return embeddings
+
+class QueryEchoStore:
+    """Vector store stand-in returning one hit whose course title is the query itself"""
+    
+    def search(self, query, **kwargs):
+        return SearchResults(
+            documents=[f"Content for {query}"],
+            metadata=[{"course_title": query, "lesson_number": 1}],
+            distances=[0.1]
+        )
+    
+    def get_lesson_link(self, course_title, lesson_number):
+        return None
@@ -1,29 +1,121 @@
-import pytest
-from unittest.mock import Mock, patch, MagicMock
-import sys
-import os
+import asyncio
+import json
+import re
+import threading
+from functools import lru_cache
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, Mock, patch
 
-# Add backend to path for imports
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import anthropic
+import pytest
 
 from ai_generator import AIGenerator
+from search_tools import CourseSearchTool, ToolManager, source_scope
+from tests.stubs import QueryEchoStore
+
+# Phrases the system prompt must contain, matched in a single pass
+REQUIRED_PROMPT_PHRASES = (
+    "search_course_content",
+    "get_course_outline",
+    "Tool Usage Guidelines",
+    "Brief, Concise and focused",
+    "Educational",
+)
+REQUIRED_PROMPT_PATTERN = re.compile("|".join(map(re.escape, REQUIRED_PROMPT_PHRASES)))
+
+# Tool definitions shared by every test; the generator copies rather than mutates them
+SEARCH_TOOLS = ({"name": "search_course_content"},)
+COURSE_TOOLS = ({"name": "get_course_outline"}, {"name": "search_course_content"})
+
+# (name, tool_id, query) rounds used across this module, warmed once per module
+KNOWN_TOOL_ROUNDS = (
+    ("search_course_content", "tool_123", "test query"),
+    ("search_course_content", "tool_123", "Python basics"),
+    ("search_course_content", "tool_0", "query 0"),
+    ("search_course_content", "tool_1", "query 1"),
+)
+
+
+@lru_cache(maxsize=32)
+def _build_tool_round(name: str, tool_id: str, query: str) -> SimpleNamespace:
+    """Build a read-only tool_use response; shared safely since AIGenerator never mutates it"""
+    tool_block = SimpleNamespace(type="tool_use", name=name, id=tool_id, input={"query": query})
+    return SimpleNamespace(stop_reason="tool_use", content=[tool_block])
+
+
+class _FakeStream:
+    """Async message stream stand-in: text events, then a start event per tool_use block"""
+    
+    def __init__(self, texts, final_message):
+        self.texts = texts
+        self.final_message = final_message
+        self.final_message_read = False
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        return False
+    
+    async def __aiter__(self):
+        for text in self.texts:
+            yield SimpleNamespace(type="text", text=text)
+        for block in self.final_message.content:
+            if block.type == "tool_use":
+                yield SimpleNamespace(type="content_block_start", content_block=block)
+    
+    async def get_final_message(self):
+        self.final_message_read = True
+        return self.final_message
+
+
+def _text_events(*texts):
+    """The stream events generate_response_stream yields for these text deltas"""
+    return [{"type": "text", "text": text} for text in texts]
+
+
+@pytest.fixture(scope="module", autouse=True)
+def warm_tool_rounds():
+    """Construct the known tool rounds before the first test needs them"""
+    for round_args in KNOWN_TOOL_ROUNDS:
+        _build_tool_round(*round_args)
 
 class TestAIGenerator:
     """Test suite for AIGenerator class"""
     
-    @pytest.fixture
+    @pytest.fixture(scope="module")
     def ai_generator(self):
-        """Create AIGenerator instance for testing"""
-        return AIGenerator("test-api-key", "claude-3-sonnet-20240229")
+        """Create one AIGenerator instance shared by the whole module"""
+        return AIGenerator("test-key", "test-model")
     
-    @pytest.fixture
-    def mock_anthropic_client(self):
-        """Create mock Anthropic client"""
-        with patch('ai_generator.anthropic.Anthropic') as mock_anthropic:
-            mock_client = Mock()
+    @pytest.fixture(scope="class")
+    @classmethod
+    def shared_anthropic_client(cls):
+        """Patch anthropic.Anthropic once for the class and share one mock client"""
+        # spec_set fixes the attribute table up front and rejects calls the real client lacks
+        mock_client = Mock(spec_set=anthropic.Anthropic)
+        mock_client.messages = Mock(spec_set=["create", "batches"])
+        mock_client.beta = Mock(spec_set=["messages"])
+        with patch('ai_generator.anthropic.Anthropic', autospec=True) as mock_anthropic:
             mock_anthropic.return_value = mock_client
             yield mock_client
     
+    @pytest.fixture
+    def mock_anthropic_client(self, shared_anthropic_client):
+        """Reset the shared mock client so no state leaks between tests"""
+        shared_anthropic_client.reset_mock(return_value=True, side_effect=True)
+        return shared_anthropic_client
+    
+    @pytest.fixture
+    def generator(self, ai_generator, mock_anthropic_client, monkeypatch):
+        """Shared AIGenerator wired to the mock client; mutable state restored after each test"""
+        monkeypatch.setattr(ai_generator, "client", mock_anthropic_client)
+        monkeypatch.setattr(ai_generator, "_async_client", None)
+        monkeypatch.setattr(ai_generator, "_tools", None)
+        monkeypatch.setattr(ai_generator, "base_params", dict(ai_generator.base_params))
+        ai_generator._response_cache.clear()
+        return ai_generator
+    
     def test_init(self):
         """Test AIGenerator initialization"""
         generator = AIGenerator("test-key", "test-model")
@@ -33,19 +125,26 @@ class TestAIGenerator:
         assert generator.base_params["temperature"] == 0
         assert generator.base_params["max_tokens"] == 800
     
-    def test_generate_response_without_tools(self, mock_anthropic_client):
+    def test_client_shared_across_instances(self):
+        """Test that generators with the same API key reuse one pooled client"""
+        generator_a = AIGenerator("shared-key", "model-a")
+        generator_b = AIGenerator("shared-key", "model-b")
+        generator_c = AIGenerator("other-key", "model-a")
+        
+        assert generator_a.client is generator_b.client
+        assert generator_a.client is not generator_c.client
+    
+    def test_generate_response_without_tools(self, generator, mock_anthropic_client):
         """Test response generation without tools"""
         # Setup mock response
-        mock_response = Mock()
-        mock_response.stop_reason = "end_turn"
-        mock_text_content = Mock()
-        mock_text_content.text = "This is a test response about Python programming."
-        mock_response.content = [mock_text_content]
+        mock_text_content = SimpleNamespace(
+            type="text",
+            text="This is a test response about Python programming."
+        )
+        mock_response = SimpleNamespace(stop_reason="end_turn", content=[mock_text_content])
         
         mock_anthropic_client.messages.create.return_value = mock_response
         
-        generator = AIGenerator("test-key", "test-model")
-        generator.client = mock_anthropic_client
         
         # Execute
         result = generator.generate_response("What is Python?")
@@ -64,19 +163,26 @@ class TestAIGenerator:
         assert call_args[1]["messages"][0]["role"] == "user"
         assert call_args[1]["messages"][0]["content"] == "What is Python?"
     
-    def test_generate_response_with_conversation_history(self, mock_anthropic_client):
+    def test_generate_response_with_stub_client(self, mock_anthropic_text_response):
+        """Test response generation against the lightweight dataclass client stub"""
+        generator = AIGenerator("test-key", "test-model")
+        generator.client = mock_anthropic_text_response
+        
+        result = generator.generate_response("What is Python?")
+        
+        assert result == "This is a sample AI response about Python programming."
+        calls = mock_anthropic_text_response.messages.calls
+        assert len(calls) == 1
+        assert calls[0]["messages"] == [{"role": "user", "content": "What is Python?"}]
+    
+    def test_generate_response_with_conversation_history(self, generator, mock_anthropic_client):
         """Test response generation with conversation history"""
         # Setup mock response
-        mock_response = Mock()
-        mock_response.stop_reason = "end_turn"
-        mock_text_content = Mock()
-        mock_text_content.text = "Continuing our Python discussion..."
-        mock_response.content = [mock_text_content]
+        mock_text_content = SimpleNamespace(type="text", text="Continuing our Python discussion...")
+        mock_response = SimpleNamespace(stop_reason="end_turn", content=[mock_text_content])
         
         mock_anthropic_client.messages.create.return_value = mock_response
         
-        generator = AIGenerator("test-key", "test-model")
-        generator.client = mock_anthropic_client
         
         # Execute with conversation history
         result = generator.generate_response(
@@ -87,25 +193,39 @@ class TestAIGenerator:
         # Verify
         assert result == "Continuing our Python discussion..."
         
-        # Verify system content includes history
+        # Verify system content includes history in its own cached block
         call_args = mock_anthropic_client.messages.create.call_args
         system_content = call_args[1]["system"]
-        assert "Previous conversation:" in system_content
-        assert "What is Python?" in system_content
+        assert len(system_content) == 2
+        assert "Previous conversation:" in system_content[1]["text"]
+        assert "What is Python?" in system_content[1]["text"]
+        assert system_content[1]["cache_control"] == {"type": "ephemeral"}
     
-    def test_generate_response_with_tools_but_no_tool_use(self, mock_anthropic_client, mock_tool_manager):
+    def test_system_prompt_cache_control(self, generator, mock_anthropic_client):
+        """Test that the static system prompt is sent as a cached block"""
+        mock_text_content = SimpleNamespace(type="text", text="Cached response")
+        mock_response = SimpleNamespace(stop_reason="end_turn", content=[mock_text_content])
+        
+        mock_anthropic_client.messages.create.return_value = mock_response
+        
+        
+        generator.generate_response("What is Python?")
+        
+        # Without history only the static prompt block is sent
+        system_content = mock_anthropic_client.messages.create.call_args[1]["system"]
+        assert len(system_content) == 1
+        assert system_content[0]["type"] == "text"
+        assert system_content[0]["text"] == AIGenerator.SYSTEM_PROMPT
+        assert system_content[0]["cache_control"] == {"type": "ephemeral"}
+    
+    def test_generate_response_with_tools_but_no_tool_use(self, generator, mock_anthropic_client, mock_tool_manager):
         """Test response generation with tools available but not used"""
         # Setup mock response without tool use
-        mock_response = Mock()
-        mock_response.stop_reason = "end_turn"
-        mock_text_content = Mock()
-        mock_text_content.text = "I can answer that without using tools."
-        mock_response.content = [mock_text_content]
+        mock_text_content = SimpleNamespace(type="text", text="I can answer that without using tools.")
+        mock_response = SimpleNamespace(stop_reason="end_turn", content=[mock_text_content])
         
         mock_anthropic_client.messages.create.return_value = mock_response
         
-        generator = AIGenerator("test-key", "test-model")
-        generator.client = mock_anthropic_client
         
         # Mock tool definitions
         tools = [{"name": "search_course_content", "description": "Search courses"}]
@@ -123,120 +243,192 @@ class TestAIGenerator:
         # Verify tools were provided in API call
         call_args = mock_anthropic_client.messages.create.call_args
         assert "tools" in call_args[1]
-        assert call_args[1]["tools"] == tools
+        assert call_args[1]["tools"] == [{**tools[0], "cache_control": {"type": "ephemeral"}}]
         assert call_args[1]["tool_choice"] == {"type": "auto"}
+        
+        # Caller's tool definitions are not mutated by the cache breakpoint
+        assert "cache_control" not in tools[0]
     
-    def test_generate_response_with_tool_use(self, mock_anthropic_client, mock_tool_manager):
-        """Test response generation that uses tools (single round)"""
-        # Setup initial response with tool use
-        mock_initial_response = Mock()
-        mock_initial_response.stop_reason = "tool_use"
+    def test_system_content_memoized_per_history(self):
+        """Test that identical history reuses the same system blocks"""
+        generator = AIGenerator("test-key", "test-model")
         
-        mock_tool_content = Mock()
-        mock_tool_content.type = "tool_use"
-        mock_tool_content.name = "search_course_content"
-        mock_tool_content.id = "tool_123"
-        mock_tool_content.input = {"query": "Python basics"}
+        first = generator._build_system_content("User: What is Python?")
+        second = generator._build_system_content("User: What is Python?")
+        other = generator._build_system_content("User: What is a list?")
         
-        mock_initial_response.content = [mock_tool_content]
+        assert first is second
+        assert other is not first
+        assert generator._build_system_content(None) == generator._build_system_content(None)
         
-        # Setup final response after tool execution (no more tool use)
-        mock_final_response = Mock()
-        mock_final_response.stop_reason = "end_turn"
-        mock_text_content = Mock()
-        mock_text_content.text = "Based on the search results, Python is a programming language..."
-        mock_final_response.content = [mock_text_content]
+        # Whitespace-only differences produce the same canonical history block
+        noisy = generator._build_system_content("User: What is Python?  \r\n")
+        assert noisy[1]["text"] == first[1]["text"]
+    
+    def test_set_tools_pins_definitions(self, generator, mock_anthropic_client, mock_tool_manager):
+        """Test that pinned tools are used when a call passes tools=None"""
+        mock_text_content = SimpleNamespace(type="text", text="Answer")
+        mock_response = SimpleNamespace(stop_reason="end_turn", content=[mock_text_content])
+        mock_anthropic_client.messages.create.return_value = mock_response
         
-        # Mock client to return different responses on subsequent calls
-        mock_anthropic_client.messages.create.side_effect = [mock_initial_response, mock_final_response]
         
-        # Mock tool manager
-        mock_tool_manager.execute_tool.return_value = "Python is a high-level programming language."
+        tools = COURSE_TOOLS
+        generator.set_tools(tools)
         
-        generator = AIGenerator("test-key", "test-model")
+        generator.generate_response("First", tool_manager=mock_tool_manager)
+        generator.generate_response("Second", tool_manager=mock_tool_manager)
+        
+        first_tools, second_tools = [
+            call[1]["tools"] for call in mock_anthropic_client.messages.create.call_args_list
+        ]
+        # The same pinned object is sent every time, with the breakpoint on the last tool
+        assert first_tools is second_tools
+        assert first_tools[-1]["cache_control"] == {"type": "ephemeral"}
+        assert "cache_control" not in tools[-1]
+        
+        # Explicit tools still take precedence over the pinned set
+        generator.generate_response("Third", tools=[{"name": "other"}], tool_manager=mock_tool_manager)
+        third_tools = mock_anthropic_client.messages.create.call_args[1]["tools"]
+        assert [tool["name"] for tool in third_tools] == ["other"]
+    
+    def test_response_cache_opt_in(self, mock_anthropic_client):
+        """Test that cache_deterministic reuses answers for identical requests only"""
+        mock_text_content = SimpleNamespace(type="text", text="Cached answer")
+        mock_response = SimpleNamespace(stop_reason="end_turn", content=[mock_text_content])
+        mock_anthropic_client.messages.create.return_value = mock_response
+        
+        generator = AIGenerator("test-key", "test-model", cache_deterministic=True)
         generator.client = mock_anthropic_client
         
-        tools = [{"name": "search_course_content"}]
+        assert generator.generate_response("What is Python?") == "Cached answer"
+        assert generator.generate_response("What is Python?") == "Cached answer"
+        assert mock_anthropic_client.messages.create.call_count == 1
+        
+        # Different history or model settings miss the cache
+        generator.generate_response("What is Python?", conversation_history="User: Hi")
+        generator.base_params["max_tokens"] = 400
+        generator.generate_response("What is Python?")
+        assert mock_anthropic_client.messages.create.call_count == 3
+        
+        # Caching stays off by default
+        uncached = AIGenerator("test-key", "test-model")
+        uncached.client = mock_anthropic_client
+        uncached.generate_response("What is Python?")
+        uncached.generate_response("What is Python?")
+        assert mock_anthropic_client.messages.create.call_count == 5
+    
+    def test_token_efficient_tools_beta(self, mock_anthropic_client, mock_tool_manager):
+        """Test that Claude 3.7 tool rounds use the token-efficient tools beta"""
+        mock_text_content = SimpleNamespace(type="text", text="Answer from 3.7")
+        mock_response = SimpleNamespace(stop_reason="end_turn", content=[mock_text_content])
+        
+        mock_anthropic_client.beta.messages.create.return_value = mock_response
+        
+        generator = AIGenerator("test-key", "claude-3-7-sonnet-20250219")
+        generator.client = mock_anthropic_client
+        
+        result = generator.generate_response(
+            "What is Python?",
+            tools=SEARCH_TOOLS,
+            tool_manager=mock_tool_manager
+        )
+        
+        assert result == "Answer from 3.7"
+        mock_anthropic_client.messages.create.assert_not_called()
+        call_args = mock_anthropic_client.beta.messages.create.call_args
+        assert call_args[1]["betas"] == [AIGenerator.TOKEN_EFFICIENT_TOOLS_BETA]
+        assert "_betas" not in call_args[1]
+    
+    @pytest.mark.parametrize("n_rounds,tool_side_effect,expected_text,expected_api_calls", [
+        (
+            1,
+            ["Python is a high-level programming language."],
+            "Based on the search results, Python is a programming language...",
+            2
+        ),
+        (
+            1,
+            Exception("Tool execution failed"),
+            "I apologize, there was an error with the search.",
+            2
+        ),
+        (
+            2,
+            ["Course outline: Lesson 4 - Variables", "Variables store data in Python..."],
+            "Final answer after 2 tool rounds.",
+            3
+        ),
+    ], ids=["single_round", "tool_error", "max_rounds"])
+    def test_generate_response_tool_rounds(self, generator, mock_anthropic_client, mock_tool_manager, response_factory,
+                                           n_rounds, tool_side_effect, expected_text, expected_api_calls):
+        """Test tool-use rounds followed by a final text response"""
+        # Setup one tool-use response per round (distinct inputs), then the final answer
+        mock_anthropic_client.messages.create.side_effect = [
+            _build_tool_round("search_course_content", f"tool_{round_number}", f"query {round_number}")
+            for round_number in range(n_rounds)
+        ] + [response_factory("end_turn", text=expected_text)]
+        mock_tool_manager.execute_tool.side_effect = tool_side_effect
         
         # Execute
         result = generator.generate_response(
             "What is Python?",
-            tools=tools,
+            tools=SEARCH_TOOLS,
             tool_manager=mock_tool_manager
         )
         
         # Verify
-        assert result == "Based on the search results, Python is a programming language..."
-        
-        # Verify tool was executed
-        mock_tool_manager.execute_tool.assert_called_once_with(
-            "search_course_content",
-            query="Python basics"
+        assert result == expected_text
+        assert mock_tool_manager.execute_tool.call_count == n_rounds
+        assert mock_tool_manager.execute_tool.call_args_list[0] == (
+            ("search_course_content",), {"query": "query 0"}
         )
+        assert mock_anthropic_client.messages.create.call_count == expected_api_calls
         
-        # Verify two API calls were made (initial + final)
-        assert mock_anthropic_client.messages.create.call_count == 2
+        # Final call carries user query plus an assistant/tool-result pair per round
+        final_call_kwargs = mock_anthropic_client.messages.create.call_args_list[-1][1]
+        messages = final_call_kwargs["messages"]
+        assert [message["role"] for message in messages] == ["user"] + ["assistant", "user"] * n_rounds
         
-        # Verify message structure
-        final_call_args = mock_anthropic_client.messages.create.call_args_list[1]
-        messages = final_call_args[1]["messages"]
-        # Should have: user query, assistant tool use, user tool results
-        assert len(messages) == 3
-        assert messages[0]["role"] == "user"
-        assert messages[1]["role"] == "assistant"
-        assert messages[2]["role"] == "user"
+        tool_result = messages[-1]["content"][0]
+        assert tool_result["type"] == "tool_result"
+        assert tool_result["tool_use_id"] == f"tool_{n_rounds - 1}"
+        if isinstance(tool_side_effect, Exception):
+            assert "Error executing tool" in tool_result["content"]
+            assert tool_result["is_error"] is True
+        else:
+            assert tool_result["content"] == tool_side_effect[-1]
+        
+        # Only the forced synthesis call after max rounds drops the tools
+        assert ("tools" in final_call_kwargs) == (n_rounds < 2)
     
-    def test_handle_tool_execution_single_tool(self, mock_anthropic_client):
-        """Test _handle_tool_execution with single tool"""
+    def test_execute_tools_single_tool(self, generator, mock_anthropic_client):
+        """Test _execute_tools_and_update_conversation with single tool"""
         # Setup
-        generator = AIGenerator("test-key", "test-model")
-        generator.client = mock_anthropic_client
         
         # Mock initial response with tool use
-        mock_initial_response = Mock()
-        mock_tool_content = Mock()
-        mock_tool_content.type = "tool_use"
-        mock_tool_content.name = "search_course_content"
-        mock_tool_content.id = "tool_123"
-        mock_tool_content.input = {"query": "test query"}
-        mock_initial_response.content = [mock_tool_content]
+        mock_initial_response = _build_tool_round("search_course_content", "tool_123", "test query")
         
         # Mock tool manager
         mock_tool_manager = Mock()
         mock_tool_manager.execute_tool.return_value = "Tool execution result"
         
-        # Mock final response
-        mock_final_response = Mock()
-        mock_text_content = Mock()
-        mock_text_content.text = "Final answer based on tool results"
-        mock_final_response.content = [mock_text_content]
-        mock_anthropic_client.messages.create.return_value = mock_final_response
-        
-        # Base parameters
-        base_params = {
-            "messages": [{"role": "user", "content": "What is Python?"}],
-            "system": "You are a helpful assistant.",
-            "model": "test-model",
-            "temperature": 0,
-            "max_tokens": 800
-        }
-        
         # Execute
-        result = generator._handle_tool_execution(mock_initial_response, base_params, mock_tool_manager)
+        messages = generator._execute_tools_and_update_conversation(
+            mock_initial_response,
+            [{"role": "user", "content": "What is Python?"}],
+            mock_tool_manager
+        )
         
         # Verify
-        assert result == "Final answer based on tool results"
         mock_tool_manager.execute_tool.assert_called_once_with(
             "search_course_content",
             query="test query"
         )
         
-        # Verify final API call structure
-        mock_anthropic_client.messages.create.assert_called_once()
-        final_call_args = mock_anthropic_client.messages.create.call_args
+        # No API call is made while executing tools
+        mock_anthropic_client.messages.create.assert_not_called()
         
         # Should have 3 messages: user query, assistant tool use, user tool results
-        messages = final_call_args[1]["messages"]
         assert len(messages) == 3
         assert messages[0]["role"] == "user"
         assert messages[1]["role"] == "assistant"
@@ -248,79 +440,349 @@ class TestAIGenerator:
         assert tool_result["tool_use_id"] == "tool_123"
         assert tool_result["content"] == "Tool execution result"
     
-    def test_handle_tool_execution_multiple_tools(self, mock_anthropic_client):
-        """Test _handle_tool_execution with multiple tools"""
+    def test_execute_tools_multiple_tools(self, generator, mock_anthropic_client):
+        """Test _execute_tools_and_update_conversation with multiple tools"""
         # Setup
-        generator = AIGenerator("test-key", "test-model")
-        generator.client = mock_anthropic_client
         
         # Mock initial response with multiple tool uses
-        mock_tool_1 = Mock()
-        mock_tool_1.type = "tool_use"
-        mock_tool_1.name = "search_course_content"
-        mock_tool_1.id = "tool_1"
-        mock_tool_1.input = {"query": "Python basics"}
-        
-        mock_tool_2 = Mock()
-        mock_tool_2.type = "tool_use"
-        mock_tool_2.name = "get_course_outline"
-        mock_tool_2.id = "tool_2"
-        mock_tool_2.input = {"course_name": "Python"}
-        
-        mock_initial_response = Mock()
-        mock_initial_response.content = [mock_tool_1, mock_tool_2]
+        mock_tool_1 = SimpleNamespace(
+            type="tool_use",
+            name="search_course_content",
+            id="tool_1",
+            input={"query": "Python basics"}
+        )
         
-        # Mock tool manager
-        mock_tool_manager = Mock()
-        mock_tool_manager.execute_tool.side_effect = [
-            "Search result for Python basics",
-            "Course outline for Python"
-        ]
+        mock_tool_2 = SimpleNamespace(
+            type="tool_use",
+            name="get_course_outline",
+            id="tool_2",
+            input={"course_name": "Python"}
+        )
         
-        # Mock final response
-        mock_final_response = Mock()
-        mock_text_content = Mock()
-        mock_text_content.text = "Combined response using both tools"
-        mock_final_response.content = [mock_text_content]
-        mock_anthropic_client.messages.create.return_value = mock_final_response
+        mock_initial_response = SimpleNamespace(content=[mock_tool_1, mock_tool_2])
         
-        base_params = {
-            "messages": [{"role": "user", "content": "Tell me about Python"}],
-            "system": "You are a helpful assistant.",
+        # Mock tool manager; tools may run concurrently, so results key off the name
+        tool_outputs = {
+            "search_course_content": "Search result for Python basics",
+            "get_course_outline": "Course outline for Python"
         }
+        mock_tool_manager = Mock()
+        mock_tool_manager.execute_tool.side_effect = lambda name, **kwargs: tool_outputs[name]
         
         # Execute
-        result = generator._handle_tool_execution(mock_initial_response, base_params, mock_tool_manager)
+        messages = generator._execute_tools_and_update_conversation(
+            mock_initial_response,
+            [{"role": "user", "content": "Tell me about Python"}],
+            mock_tool_manager
+        )
         
         # Verify
-        assert result == "Combined response using both tools"
         assert mock_tool_manager.execute_tool.call_count == 2
         
         # Verify tool execution calls
         calls = mock_tool_manager.execute_tool.call_args_list
-        assert calls[0][0] == ("search_course_content",)
-        assert calls[0][1] == {"query": "Python basics"}
-        assert calls[1][0] == ("get_course_outline",)
-        assert calls[1][1] == {"course_name": "Python"}
-        
-        # Verify final message structure
-        final_call_args = mock_anthropic_client.messages.create.call_args
-        messages = final_call_args[1]["messages"]
+        assert {(call[0], tuple(call[1].items())) for call in calls} == {
+            (("search_course_content",), (("query", "Python basics"),)),
+            (("get_course_outline",), (("course_name", "Python"),))
+        }
         
         # Should have tool results for both tools
         tool_results = messages[2]["content"]
         assert len(tool_results) == 2
         assert tool_results[0]["tool_use_id"] == "tool_1"
+        assert tool_results[0]["content"] == "Search result for Python basics"
         assert tool_results[1]["tool_use_id"] == "tool_2"
+        assert tool_results[1]["content"] == "Course outline for Python"
+    
+    def test_parallel_tool_blocks_preserve_order(self, generator, mock_anthropic_client):
+        """Test that multiple tool_use blocks run concurrently but keep result order"""
+        
+        mock_tool_1 = SimpleNamespace(
+            type="tool_use",
+            name="search_course_content",
+            id="tool_1",
+            input={"query": "Python basics"}
+        )
+        
+        mock_tool_2 = SimpleNamespace(
+            type="tool_use",
+            name="get_course_outline",
+            id="tool_2",
+            input={"course_name": "Python"}
+        )
+        
+        mock_response = SimpleNamespace(content=[mock_tool_1, mock_tool_2])
+        
+        # Both tools must be in flight at once for the barrier to release
+        barrier = threading.Barrier(2, timeout=5)
+        
+        def execute_tool(name, **kwargs):
+            barrier.wait()
+            if name == "get_course_outline":
+                raise Exception("Outline unavailable")
+            return f"Result for {name}"
+        
+        mock_tool_manager = Mock()
+        mock_tool_manager.execute_tool.side_effect = execute_tool
+        
+        
+        messages = generator._execute_tools_and_update_conversation(
+            mock_response, [{"role": "user", "content": "Tell me about Python"}], mock_tool_manager
+        )
+        
+        tool_results = messages[2]["content"]
+        assert [result["tool_use_id"] for result in tool_results] == ["tool_1", "tool_2"]
+        assert tool_results[0]["content"] == "Result for search_course_content"
+        assert tool_results[1]["is_error"] is True
+        assert "Outline unavailable" in tool_results[1]["content"]
+    
+    def test_parallel_search_sources_follow_block_order(self, generator):
+        """Test the last search block's sources win even when it finishes first"""
+        first_done = threading.Event()
+        
+        class ReverseFinishToolManager(ToolManager):
+            """Holds the first search back until the second has recorded its sources"""
+            def execute_tool(self, tool_name, **kwargs):
+                if kwargs["query"] == "Course A":
+                    assert first_done.wait(timeout=5)
+                result = super().execute_tool(tool_name, **kwargs)
+                if kwargs["query"] == "Course B":
+                    first_done.set()
+                return result
+        
+        manager = ReverseFinishToolManager()
+        manager.register_tool(CourseSearchTool(QueryEchoStore()))
+        response = SimpleNamespace(content=[
+            SimpleNamespace(type="tool_use", name="search_course_content", id="tool_a",
+                            input={"query": "Course A"}),
+            SimpleNamespace(type="tool_use", name="search_course_content", id="tool_b",
+                            input={"query": "Course B"}),
+        ])
+        
+        with source_scope():
+            generator._execute_tools_and_update_conversation(response, [], manager)
+            assert manager.get_last_sources() == ["Course B - Lesson 1"]
+        
+        first_done.clear()
+        
+        async def run_async():
+            with source_scope():
+                await generator._execute_tools_and_update_conversation_async(response, [], manager)
+                return manager.get_last_sources()
+        
+        assert asyncio.run(run_async()) == ["Course B - Lesson 1"]
+        
+        # Outside any request scope the tool's own sources follow block order too
+        first_done.clear()
+        generator._execute_tools_and_update_conversation(response, [], manager)
+        assert manager.get_last_sources() == ["Course B - Lesson 1"]
+    
+    def test_async_client_is_per_event_loop(self):
+        """Test each event loop gets its own async client, which aclose() closes"""
+        generator = AIGenerator("test-key", "test-model")
+        
+        async def get_clients():
+            return generator.async_client, generator.async_client
+        
+        first, again = asyncio.run(get_clients())
+        second, _ = asyncio.run(get_clients())
+        assert first is again
+        assert second is not first
+        
+        async def close():
+            client = generator.async_client
+            await generator.aclose()
+            return client
+        
+        assert asyncio.run(close()).is_closed()
+    
+    def test_generate_response_async_with_tool_use(self, generator, mock_tool_manager):
+        """Test async response generation through AsyncAnthropic with one tool round"""
+        
+        mock_initial_response = _build_tool_round("search_course_content", "tool_123", "Python basics")
+        
+        mock_text_content = SimpleNamespace(type="text", text="Python is a programming language.")
+        mock_final_response = SimpleNamespace(stop_reason="end_turn", content=[mock_text_content])
+        
+        mock_async_client = Mock()
+        mock_async_client.messages.create = AsyncMock(
+            side_effect=[mock_initial_response, mock_final_response]
+        )
+        
+        generator.async_client = mock_async_client
+        
+        result = asyncio.run(generator.generate_response_async(
+            "What is Python?",
+            tools=SEARCH_TOOLS,
+            tool_manager=mock_tool_manager
+        ))
+        
+        assert result == "Python is a programming language."
+        mock_tool_manager.execute_tool.assert_called_once_with(
+            "search_course_content",
+            query="Python basics"
+        )
+        assert mock_async_client.messages.create.await_count == 2
+        
+        messages = mock_async_client.messages.create.call_args_list[1][1]["messages"]
+        assert len(messages) == 3
+        assert messages[2]["content"][0]["tool_use_id"] == "tool_123"
+    
+    def test_generate_response_stream_with_tool_use(self, generator, mock_tool_manager):
+        """Test streaming yields final text deltas after a tool round"""
+        
+        tool_message = _build_tool_round("search_course_content", "tool_123", "Python basics")
+        final_message = SimpleNamespace(stop_reason="end_turn", content=[])
+        
+        mock_async_client = Mock()
+        mock_async_client.messages.stream.side_effect = [
+            _FakeStream([], tool_message),
+            _FakeStream(["Python ", "is ", "great."], final_message)
+        ]
+        
+        generator.async_client = mock_async_client
+        
+        async def collect():
+            return [event async for event in generator.generate_response_stream(
+                "What is Python?",
+                tools=SEARCH_TOOLS,
+                tool_manager=mock_tool_manager
+            )]
+        
+        events = asyncio.run(collect())
+        
+        assert events == _text_events("Python ", "is ", "great.")
+        mock_tool_manager.execute_tool.assert_called_once_with(
+            "search_course_content",
+            query="Python basics"
+        )
+        assert mock_async_client.messages.stream.call_count == 2
+        second_call_messages = mock_async_client.messages.stream.call_args_list[1][1]["messages"]
+        assert second_call_messages[2]["content"][0]["tool_use_id"] == "tool_123"
+    
+    def test_generate_response_stream_discards_tool_round_preamble(self, generator, mock_tool_manager):
+        """Test text spoken before a tool call is streamed, then discarded once the call starts"""
+        tool_message = _build_tool_round("search_course_content", "tool_123", "Python basics")
+        final_message = SimpleNamespace(stop_reason="end_turn", content=[])
+        
+        mock_async_client = Mock()
+        mock_async_client.messages.stream.side_effect = [
+            _FakeStream(["Let me search ", "for that."], tool_message),
+            _FakeStream(["Python ", "is ", "great."], final_message)
+        ]
+        
+        generator.async_client = mock_async_client
+        
+        async def collect():
+            return [event async for event in generator.generate_response_stream(
+                "What is Python?",
+                tools=SEARCH_TOOLS,
+                tool_manager=mock_tool_manager
+            )]
+        
+        events = asyncio.run(collect())
+        
+        assert events == (_text_events("Let me search ", "for that.") + [{"type": "discard"}]
+                          + _text_events("Python ", "is ", "great."))
+        mock_tool_manager.execute_tool.assert_called_once()
+    
+    def test_generate_response_stream_yields_before_round_completes(self, generator, mock_tool_manager):
+        """Test the first delta reaches the caller before the round's final message exists"""
+        answer = _FakeStream(["Python ", "is ", "great."], SimpleNamespace(stop_reason="end_turn", content=[]))
+        mock_async_client = Mock()
+        mock_async_client.messages.stream.return_value = answer
+        generator.async_client = mock_async_client
+        
+        async def first_event():
+            stream = generator.generate_response_stream(
+                "What is Python?",
+                tools=SEARCH_TOOLS,
+                tool_manager=mock_tool_manager
+            )
+            event = await anext(stream)
+            read_before_first_event = answer.final_message_read
+            rest = [event async for event in stream]
+            return event, read_before_first_event, rest
+        
+        event, read_before_first_event, rest = asyncio.run(first_event())
+        
+        assert event == {"type": "text", "text": "Python "}
+        assert read_before_first_event is False
+        assert rest == _text_events("is ", "great.")
+        mock_tool_manager.execute_tool.assert_not_called()
+    
+    def test_generate_response_batch(self, generator, mock_anthropic_client):
+        """Test batch generation submits one job, polls until ended, and orders results"""
+        mock_anthropic_client.messages.batches.create.return_value = SimpleNamespace(
+            id="batch_1", processing_status="in_progress"
+        )
+        mock_anthropic_client.messages.batches.retrieve.return_value = SimpleNamespace(
+            id="batch_1", processing_status="ended"
+        )
+        
+        def succeeded(custom_id, text):
+            text_block = SimpleNamespace(type="text", text=text)
+            return SimpleNamespace(custom_id=custom_id, result=SimpleNamespace(
+                type="succeeded",
+                message=SimpleNamespace(content=[text_block])
+            ))
+        
+        errored = SimpleNamespace(custom_id="q2", result=SimpleNamespace(type="errored"))
+        
+        # Results arrive out of order
+        mock_anthropic_client.messages.batches.results.return_value = [
+            succeeded("q1", "Answer two"), errored, succeeded("q0", "Answer one")
+        ]
+        
+        
+        with patch('ai_generator.time.sleep') as mock_sleep:
+            results = generator.generate_response_batch(["Q1", "Q2", "Q3"])
+        
+        assert results[0] == "Answer one"
+        assert results[1] == "Answer two"
+        assert "errored" in results[2]
+        mock_sleep.assert_called_once_with(1.0)
+        mock_anthropic_client.messages.create.assert_not_called()
+        
+        requests = mock_anthropic_client.messages.batches.create.call_args[1]["requests"]
+        assert [request["custom_id"] for request in requests] == ["q0", "q1", "q2"]
+        assert requests[1]["params"]["messages"] == [{"role": "user", "content": "Q2"}]
+        assert requests[1]["params"]["model"] == "test-model"
+        assert "tools" not in requests[1]["params"]
+    
+    def test_generate_response_multi(self, generator, mock_anthropic_client, sample_query_scenarios):
+        """Test batch-prompting several questions in one call and splitting the answers"""
+        queries = [
+            sample_query_scenarios["simple_query"],
+            sample_query_scenarios["lesson_specific"],
+            sample_query_scenarios["nonexistent_course"]
+        ]
+        
+        # Answers out of order, one quoted id, one missing
+        mock_text_content = SimpleNamespace(type="text", text=(
+            '<answers><answer id=2>Lesson 1 covers basics.</answer>'
+            '<answer id="1">\nPython is a language.\n</answer></answers>'
+        ))
+        mock_response = SimpleNamespace(stop_reason="end_turn", content=[mock_text_content])
+        mock_anthropic_client.messages.create.return_value = mock_response
+        
+        
+        answers = generator.generate_response_multi(queries)
+        
+        assert answers == ["Python is a language.", "Lesson 1 covers basics.", ""]
+        mock_anthropic_client.messages.create.assert_called_once()
+        call_args = mock_anthropic_client.messages.create.call_args[1]
+        prompt = call_args["messages"][0]["content"]
+        assert "1. What is Python?" in prompt
+        assert "3. Tell me about JavaScript basics" in prompt
+        assert call_args["max_tokens"] == 2400
+        assert "tools" not in call_args
     
     def test_system_prompt_content(self):
         """Test that the system prompt contains expected instructions"""
-        # Verify system prompt has key components
-        assert "search_course_content" in AIGenerator.SYSTEM_PROMPT
-        assert "get_course_outline" in AIGenerator.SYSTEM_PROMPT
-        assert "Tool Usage Guidelines" in AIGenerator.SYSTEM_PROMPT
-        assert "Brief, Concise and focused" in AIGenerator.SYSTEM_PROMPT
-        assert "Educational" in AIGenerator.SYSTEM_PROMPT
+        # Verify system prompt has key components, scanning it once
+        found = set(REQUIRED_PROMPT_PATTERN.findall(AIGenerator.SYSTEM_PROMPT))
+        assert found == set(REQUIRED_PROMPT_PHRASES)
     
     def test_base_params_structure(self):
         """Test that base parameters are properly structured"""
@@ -331,13 +793,11 @@ class TestAIGenerator:
         assert generator.base_params["max_tokens"] == 800
         assert len(generator.base_params) == 3
     
-    def test_generate_response_api_exception(self, mock_anthropic_client):
+    def test_generate_response_api_exception(self, generator, mock_anthropic_client):
         """Test handling of API exceptions during response generation"""
         # Setup mock to raise exception
         mock_anthropic_client.messages.create.side_effect = Exception("API Error")
         
-        generator = AIGenerator("test-key", "test-model")
-        generator.client = mock_anthropic_client
         
         # Execute and verify exception is raised
         with pytest.raises(Exception) as exc_info:
@@ -345,19 +805,14 @@ class TestAIGenerator:
         
         assert "API Error" in str(exc_info.value)
     
-    def test_generate_response_empty_query(self, mock_anthropic_client):
+    def test_generate_response_empty_query(self, generator, mock_anthropic_client):
         """Test response generation with empty query"""
         # Setup mock response
-        mock_response = Mock()
-        mock_response.stop_reason = "end_turn"
-        mock_text_content = Mock()
-        mock_text_content.text = "I need more information to help you."
-        mock_response.content = [mock_text_content]
+        mock_text_content = SimpleNamespace(type="text", text="I need more information to help you.")
+        mock_response = SimpleNamespace(stop_reason="end_turn", content=[mock_text_content])
         
         mock_anthropic_client.messages.create.return_value = mock_response
         
-        generator = AIGenerator("test-key", "test-model")
-        generator.client = mock_anthropic_client
         
         # Execute
         result = generator.generate_response("")
@@ -365,20 +820,14 @@ class TestAIGenerator:
         # Verify it still processes (doesn't filter empty queries)
         assert result == "I need more information to help you."
     
-    def test_tool_execution_without_tool_manager(self, mock_anthropic_client):
+    def test_tool_execution_without_tool_manager(self, generator, mock_anthropic_client):
         """Test tool execution when tool_manager is None"""
         # Setup mock response with tool use
-        mock_response = Mock()
-        mock_response.stop_reason = "tool_use"
-        mock_tool_content = Mock()
-        mock_tool_content.type = "tool_use"
-        mock_tool_content.text = "I tried to use a tool but couldn't."
-        mock_response.content = [mock_tool_content]
+        mock_tool_content = SimpleNamespace(type="tool_use", text="I tried to use a tool but couldn't.")
+        mock_response = SimpleNamespace(stop_reason="tool_use", content=[mock_tool_content])
         
         mock_anthropic_client.messages.create.return_value = mock_response
         
-        generator = AIGenerator("test-key", "test-model")
-        generator.client = mock_anthropic_client
         
         tools = [{"name": "test_tool"}]
         
@@ -393,56 +842,78 @@ class TestAIGenerator:
         # This tests the condition where stop_reason == "tool_use" but tool_manager is None
         assert result == "I tried to use a tool but couldn't."
         
-        # Should only make one API call
+        # Should only make one API call, and it skips tools that could not be executed
         assert mock_anthropic_client.messages.create.call_count == 1
+        assert "tools" not in mock_anthropic_client.messages.create.call_args[1]
     
-    def test_generate_response_two_tool_rounds(self, mock_anthropic_client, mock_tool_manager):
-        """Test response generation with two rounds of tool calls"""
-        # Setup first response with tool use
-        mock_round1_response = Mock()
-        mock_round1_response.stop_reason = "tool_use"
-        mock_tool1_content = Mock()
-        mock_tool1_content.type = "tool_use"
-        mock_tool1_content.name = "get_course_outline"
-        mock_tool1_content.id = "tool_1"
-        mock_tool1_content.input = {"course_name": "Python Course"}
-        mock_round1_response.content = [mock_tool1_content]
-        
-        # Setup second response with tool use
-        mock_round2_response = Mock()
-        mock_round2_response.stop_reason = "tool_use"
-        mock_tool2_content = Mock()
-        mock_tool2_content.type = "tool_use"
-        mock_tool2_content.name = "search_course_content"
-        mock_tool2_content.id = "tool_2"
-        mock_tool2_content.input = {"query": "lesson 4 variables"}
-        mock_round2_response.content = [mock_tool2_content]
-        
-        # Setup final response (no tool use)
-        mock_final_response = Mock()
-        mock_final_response.stop_reason = "end_turn"
-        mock_text_content = Mock()
-        mock_text_content.text = "Lesson 4 covers variables and data types in Python."
-        mock_final_response.content = [mock_text_content]
-        
-        # Mock client to return responses in sequence
+    def test_generate_response_repeated_tool_call_forces_synthesis(self, generator, mock_anthropic_client, mock_tool_manager):
+        """Test that re-requesting identical tool calls ends the tool loop early"""
+        mock_tool_content = SimpleNamespace(
+            type="tool_use",
+            name="search_course_content",
+            id="tool_123",
+            input={"query": "test", "course_name": "Python"}
+        )
+        mock_tool_response = SimpleNamespace(stop_reason="tool_use", content=[mock_tool_content])
+        
+        mock_text_content = SimpleNamespace(type="text", text="Synthesized answer.")
+        mock_final_response = SimpleNamespace(stop_reason="end_turn", content=[mock_text_content])
+        
         mock_anthropic_client.messages.create.side_effect = [
-            mock_round1_response, mock_round2_response, mock_final_response
+            mock_tool_response, mock_tool_response, mock_final_response
         ]
+        mock_tool_manager.execute_tool.return_value = "Tool result"
         
-        # Mock tool manager with different results for each tool
+        
+        # Allow more rounds than needed so only the repeat detection stops the loop
+        result = generator.generate_response(
+            "Query that loops on one search",
+            tools=SEARCH_TOOLS,
+            tool_manager=mock_tool_manager,
+            max_rounds=5
+        )
+        
+        assert result == "Synthesized answer."
+        assert mock_anthropic_client.messages.create.call_count == 3
+        final_call_args = mock_anthropic_client.messages.create.call_args_list[2]
+        assert "tools" not in final_call_args[1]
+
+
+@pytest.fixture(scope="module")
+def vcr_config():
+    """Keep credentials out of cassettes; record mode stays "none" unless --record-mode is passed"""
+    return {"filter_headers": ["x-api-key", "authorization"]}
+
+
+class TestAIGeneratorRecorded:
+    """Multi-round tool flows replayed from recorded Messages API exchanges
+    
+    Cassettes live in cassettes/test_ai_generator/. Re-record with
+    `pytest --record-mode=rewrite` and a real ANTHROPIC_API_KEY.
+    """
+    
+    @pytest.fixture
+    def recorded_generator(self, monkeypatch):
+        """AIGenerator backed by a real Anthropic client whose HTTP traffic vcr replays"""
+        generator = AIGenerator("test-key", "claude-sonnet-4-20250514")
+        monkeypatch.setattr(generator, "client", anthropic.Anthropic(
+            api_key="test-key",
+            base_url="https://api.anthropic.com",
+            max_retries=0
+        ))
+        return generator
+    
+    @pytest.mark.vcr
+    def test_generate_response_two_tool_rounds(self, recorded_generator, mock_tool_manager, vcr):
+        """Test response generation with two rounds of tool calls"""
         mock_tool_manager.execute_tool.side_effect = [
             "Course outline: Lesson 4 - Variables and Data Types",
             "Variables are used to store data in Python..."
         ]
-        
-        generator = AIGenerator("test-key", "test-model")
-        generator.client = mock_anthropic_client
-        
-        tools = [{"name": "get_course_outline"}, {"name": "search_course_content"}]
+        tools = COURSE_TOOLS
         
         # Execute
-        result = generator.generate_response(
+        result = recorded_generator.generate_response(
             "What does lesson 4 of Python Course cover?",
             tools=tools,
             tool_manager=mock_tool_manager
@@ -460,41 +931,16 @@ class TestAIGenerator:
         assert calls[1][1] == {"query": "lesson 4 variables"}
         
         # Verify three API calls were made (round1 + round2 + final)
-        assert mock_anthropic_client.messages.create.call_count == 3
+        assert vcr.play_count == 3
     
-    def test_generate_response_max_rounds_reached(self, mock_anthropic_client, mock_tool_manager):
+    @pytest.mark.vcr
+    def test_generate_response_max_rounds_reached(self, recorded_generator, mock_tool_manager, vcr):
         """Test that max rounds (2) is enforced and final call made without tools"""
-        # Setup responses that always want to use tools
-        mock_tool_response = Mock()
-        mock_tool_response.stop_reason = "tool_use"
-        mock_tool_content = Mock()
-        mock_tool_content.type = "tool_use"
-        mock_tool_content.name = "search_course_content"
-        mock_tool_content.id = "tool_123"
-        mock_tool_content.input = {"query": "test"}
-        mock_tool_response.content = [mock_tool_content]
-        
-        # Final response without tools
-        mock_final_response = Mock()
-        mock_final_response.stop_reason = "end_turn"
-        mock_text_content = Mock()
-        mock_text_content.text = "Final answer after 2 tool rounds."
-        mock_final_response.content = [mock_text_content]
-        
-        # Return tool use for first 2 calls, then final response
-        mock_anthropic_client.messages.create.side_effect = [
-            mock_tool_response, mock_tool_response, mock_final_response
-        ]
-        
         mock_tool_manager.execute_tool.return_value = "Tool result"
-        
-        generator = AIGenerator("test-key", "test-model")
-        generator.client = mock_anthropic_client
-        
-        tools = [{"name": "search_course_content"}]
+        tools = SEARCH_TOOLS
         
         # Execute
-        result = generator.generate_response(
+        result = recorded_generator.generate_response(
             "Complex query requiring multiple searches",
             tools=tools,
             tool_manager=mock_tool_manager
@@ -507,58 +953,8 @@ class TestAIGenerator:
         assert mock_tool_manager.execute_tool.call_count == 2
         
         # Verify 3 API calls (2 tool rounds + final without tools)
-        assert mock_anthropic_client.messages.create.call_count == 3
+        assert vcr.play_count == 3
         
         # Verify final call had no tools parameter
-        final_call_args = mock_anthropic_client.messages.create.call_args_list[2]
-        assert "tools" not in final_call_args[1]
-    
-    def test_generate_response_tool_error_handling(self, mock_anthropic_client, mock_tool_manager):
-        """Test graceful handling of tool execution errors"""
-        # Setup response with tool use
-        mock_tool_response = Mock()
-        mock_tool_response.stop_reason = "tool_use"
-        mock_tool_content = Mock()
-        mock_tool_content.type = "tool_use"
-        mock_tool_content.name = "search_course_content"
-        mock_tool_content.id = "tool_123"
-        mock_tool_content.input = {"query": "test"}
-        mock_tool_response.content = [mock_tool_content]
-        
-        # Final response
-        mock_final_response = Mock()
-        mock_final_response.stop_reason = "end_turn"
-        mock_text_content = Mock()
-        mock_text_content.text = "I apologize, there was an error with the search."
-        mock_final_response.content = [mock_text_content]
-        
-        mock_anthropic_client.messages.create.side_effect = [mock_tool_response, mock_final_response]
-        
-        # Mock tool manager to raise exception
-        mock_tool_manager.execute_tool.side_effect = Exception("Tool execution failed")
-        
-        generator = AIGenerator("test-key", "test-model")
-        generator.client = mock_anthropic_client
-        
-        tools = [{"name": "search_course_content"}]
-        
-        # Execute
-        result = generator.generate_response(
-            "Search for something",
-            tools=tools,
-            tool_manager=mock_tool_manager
-        )
-        
-        # Should complete successfully despite tool error
-        assert result == "I apologize, there was an error with the search."
-        
-        # Verify tool execution was attempted
-        mock_tool_manager.execute_tool.assert_called_once()
-        
-        # Verify conversation continued with error in tool results
-        final_call_args = mock_anthropic_client.messages.create.call_args_list[1]
-        messages = final_call_args[1]["messages"]
-        tool_result_msg = messages[2]["content"][0]
-        assert tool_result_msg["type"] == "tool_result"
-        assert "Error executing tool" in tool_result_msg["content"]
-        assert tool_result_msg["is_error"] is True
\ No newline at end of file
+        final_body = json.loads(vcr.requests[2].body)
+        assert "tools" not in final_body
@@ -0,0 +1,66 @@
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+for tool in ("black", "isort", "flake8", "mypy"):
+    pytest.importorskip(tool)
+
+# scripts/ isn't a package, so load the runner straight from its file
+_RUNNER_PATH = Path(__file__).resolve().parents[2] / "scripts" / "_run_checks.py"
+_spec = importlib.util.spec_from_file_location("_run_checks", _RUNNER_PATH)
+run_checks_module = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(run_checks_module)
+
+pytestmark = pytest.mark.slow
+
+
+class TestRunChecks:
+    """Test the in-process code quality runner against the real tools"""
+    
+    @pytest.fixture(autouse=True)
+    def isolated_cwd(self, tmp_path, monkeypatch):
+        """Run each tool from an empty directory so no project config applies"""
+        monkeypatch.chdir(tmp_path)
+    
+    def test_formatters_rewrite_files_in_process(self, tmp_path):
+        """Test black and isort both run and leave the file formatted and sorted"""
+        source = tmp_path / "messy.py"
+        source.write_text("import sys\nimport os\nx=1\n")
+        
+        return_codes = run_checks_module.run_checks([str(source)], ["black", "isort"])
+        
+        assert return_codes == {"Black formatting": 0, "Import sorting": 0}
+        assert source.read_text() == "import os\nimport sys\n\nx = 1\n"
+    
+    def test_checks_report_each_tool_result(self, tmp_path):
+        """Test per-tool exit codes are collected in CHECKS order, failures included"""
+        source = tmp_path / "unused.py"
+        source.write_text("import os\n\n\ndef answer() -> int:\n    return 42\n")
+        
+        return_codes = run_checks_module.run_checks([str(source)], ["mypy", "flake8"])
+        
+        assert list(return_codes) == ["Flake8 linting", "MyPy type checking"]
+        assert return_codes["Flake8 linting"] != 0  # F401 'os' imported but unused
+        assert return_codes["MyPy type checking"] == 0
+    
+    def test_main_summarizes_and_fails_on_any_error(self, tmp_path, capsys):
+        """Test main prints a pass/fail line per tool and exits non-zero on a failure"""
+        source = tmp_path / "wrong.py"
+        source.write_text("def answer() -> str:\n    return 42\n")
+        
+        exit_code = run_checks_module.main(["--only", "black,mypy", str(source)])
+        
+        output = capsys.readouterr().out
+        assert exit_code == 1
+        assert "✅ Black formatting passed" in output
+        assert "❌ MyPy type checking failed" in output
+    
+    def test_black_usage_error_is_reported(self, tmp_path):
+        """Test a black usage error becomes a failed result instead of a crash"""
+        assert run_checks_module.run_black([str(tmp_path / "missing.py")]) != 0
+    
+    def test_unknown_tool_is_rejected(self, tmp_path):
+        """Test --only refuses tool names the runner doesn't know"""
+        with pytest.raises(SystemExit):
+            run_checks_module.main(["--only", "pylint", str(tmp_path)])
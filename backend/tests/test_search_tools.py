@@ -1,27 +1,119 @@
+import asyncio
 import pytest
-from unittest.mock import Mock, patch
-import sys
-import os
+from functools import lru_cache
+from typing import Optional
 
-# Add backend to path for imports
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-
-from search_tools import CourseSearchTool, CourseOutlineTool, ToolManager
+from search_tools import CourseSearchTool, CourseOutlineTool, ToolManager, source_scope
 from vector_store import SearchResults
+from tests.stubs import QueryEchoStore, StubVectorStore
+
+pytestmark = pytest.mark.unit
+
+# Tool definitions as sent to Anthropic, compared whole so any schema drift fails one assert
+EXPECTED_SEARCH_TOOL_DEF = {
+    "name": "search_course_content",
+    "description": "Search course materials with smart course name matching and lesson filtering",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "query": {
+                "type": "string",
+                "description": "What to search for in the course content"
+            },
+            "course_name": {
+                "type": "string",
+                "description": "Course title (partial matches work, e.g. 'MCP', 'Introduction')"
+            },
+            "lesson_number": {
+                "type": "integer",
+                "description": "Specific lesson number to search within (e.g. 1, 2, 3)"
+            }
+        },
+        "required": ["query"]
+    }
+}
+
+EXPECTED_OUTLINE_TOOL_DEF = {
+    "name": "get_course_outline",
+    "description": "Get complete course outline including title, link, and all lessons",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "course_name": {
+                "type": "string",
+                "description": "Course title or partial name to get outline for"
+            }
+        },
+        "required": ["course_name"]
+    }
+}
+
+@lru_cache(maxsize=None)
+def _build_results(course_title: str, lesson_number: Optional[int] = None, document: str = "Sample content about Python") -> SearchResults:
+    """Build (once per distinct argument set) a read-only single-hit SearchResults"""
+    return SearchResults(
+        documents=[document],
+        metadata=[{"course_title": course_title, "lesson_number": lesson_number}],
+        distances=[0.1]
+    )
+
+def _assert_no_sources(tool):
+    """Assert a search left no sources behind"""
+    assert not tool.last_sources, f"expected no sources, got {tool.last_sources!r}"
+
+@pytest.fixture(scope="class")
+def shared_vector_store():
+    """One stub vector store per test class, reset before each test"""
+    return StubVectorStore()
+
+@pytest.fixture
+def fake_vector_store(shared_vector_store):
+    """The class-shared stub vector store, restored to its defaults"""
+    return shared_vector_store.reset()
+
+@pytest.fixture
+def configured_store(request, fake_vector_store, successful_search_results, empty_search_results, error_search_results):
+    """fake_vector_store whose search returns a named scenario, "success" unless parametrized indirectly"""
+    scenarios = {
+        "success": successful_search_results,
+        "empty": empty_search_results,
+        "error": error_search_results
+    }
+    fake_vector_store.search_return = scenarios[getattr(request, "param", "success")]
+    return fake_vector_store
 
 class TestCourseSearchTool:
     """Test suite for CourseSearchTool.execute() method"""
     
-    def test_successful_search_with_results(self, mock_vector_store, successful_search_results):
-        """Test successful search that returns results"""
+    @pytest.fixture(scope="class")
+    @classmethod
+    def shared_search_tool(cls, shared_vector_store):
+        """Build the search tool once for the class"""
+        return CourseSearchTool(shared_vector_store)
+    
+    @pytest.fixture
+    def search_tool(self, shared_search_tool, fake_vector_store):
+        """The class-shared search tool with its store reset and sources cleared"""
+        shared_search_tool.last_sources = []
+        return shared_search_tool
+    
+    @pytest.mark.parametrize("course_name,lesson_number", [
+        (None, None),
+        ("Python Programming", None),
+        (None, 1),
+        ("Python Programming", 2),
+    ], ids=["no_filter", "course", "lesson", "both"])
+    def test_search_with_filters(self, search_tool, configured_store, course_name, lesson_number):
+        """Test search passes course and lesson filters through to the vector store"""
         # Setup
-        mock_vector_store.search.return_value = successful_search_results
-        mock_vector_store.get_lesson_link.return_value = "https://example.com/lesson1"
-        
-        tool = CourseSearchTool(mock_vector_store)
+        configured_store.lesson_link = "https://example.com/lesson1"
         
         # Execute
-        result = tool.execute(query="What is Python?")
+        result = search_tool.execute(
+            query="What is Python?",
+            course_name=course_name,
+            lesson_number=lesson_number
+        )
         
         # Verify
         assert result != ""
@@ -30,246 +122,118 @@ class TestCourseSearchTool:
         assert "Python is a programming language" in result
         
         # Verify vector store was called correctly
-        mock_vector_store.search.assert_called_once_with(
-            query="What is Python?",
-            course_name=None,
-            lesson_number=None
-        )
+        assert configured_store.calls == [{
+            "query": "What is Python?",
+            "course_name": course_name,
+            "lesson_number": lesson_number
+        }]
         
         # Verify sources were stored
-        assert len(tool.last_sources) == 2
-        assert "Python Programming Basics - Lesson 1" in tool.last_sources[0]
-        assert "Python Programming Basics - Lesson 2" in tool.last_sources[1]
-    
-    def test_search_with_course_filter(self, mock_vector_store, successful_search_results):
-        """Test search with course name filter"""
-        # Setup
-        mock_vector_store.search.return_value = successful_search_results
-        
-        tool = CourseSearchTool(mock_vector_store)
-        
-        # Execute
-        result = tool.execute(
-            query="What is Python?", 
-            course_name="Python Programming"
-        )
-        
-        # Verify
-        assert result != ""
-        mock_vector_store.search.assert_called_once_with(
-            query="What is Python?",
-            course_name="Python Programming",
-            lesson_number=None
-        )
-    
-    def test_search_with_lesson_filter(self, mock_vector_store, successful_search_results):
-        """Test search with lesson number filter"""
-        # Setup
-        mock_vector_store.search.return_value = successful_search_results
-        
-        tool = CourseSearchTool(mock_vector_store)
-        
-        # Execute
-        result = tool.execute(
-            query="What is Python?",
-            lesson_number=1
-        )
-        
-        # Verify
-        assert result != ""
-        mock_vector_store.search.assert_called_once_with(
-            query="What is Python?",
-            course_name=None,
-            lesson_number=1
-        )
-    
-    def test_search_with_both_filters(self, mock_vector_store, successful_search_results):
-        """Test search with both course name and lesson number filters"""
-        # Setup
-        mock_vector_store.search.return_value = successful_search_results
-        
-        tool = CourseSearchTool(mock_vector_store)
-        
-        # Execute
-        result = tool.execute(
-            query="What is Python?",
-            course_name="Python Programming",
-            lesson_number=2
-        )
-        
-        # Verify
-        assert result != ""
-        mock_vector_store.search.assert_called_once_with(
-            query="What is Python?",
-            course_name="Python Programming",
-            lesson_number=2
-        )
-    
-    def test_empty_search_results(self, mock_vector_store, empty_search_results):
-        """Test handling of empty search results"""
-        # Setup
-        mock_vector_store.search.return_value = empty_search_results
-        
-        tool = CourseSearchTool(mock_vector_store)
-        
-        # Execute
-        result = tool.execute(query="nonexistent topic")
-        
-        # Verify
-        assert "No relevant content found" in result
-        assert tool.last_sources == []
-    
-    def test_empty_results_with_course_filter(self, mock_vector_store, empty_search_results):
-        """Test empty results with course filter shows filter info"""
-        # Setup
-        mock_vector_store.search.return_value = empty_search_results
-        
-        tool = CourseSearchTool(mock_vector_store)
-        
-        # Execute
-        result = tool.execute(
-            query="nonexistent topic",
-            course_name="Python Programming"
-        )
-        
-        # Verify
-        assert "No relevant content found in course 'Python Programming'" in result
+        assert len(search_tool.last_sources) == 2
+        assert "Python Programming Basics - Lesson 1" in search_tool.last_sources[0]
+        assert "Python Programming Basics - Lesson 2" in search_tool.last_sources[1]
     
-    def test_empty_results_with_lesson_filter(self, mock_vector_store, empty_search_results):
-        """Test empty results with lesson filter shows filter info"""
-        # Setup
-        mock_vector_store.search.return_value = empty_search_results
-        
-        tool = CourseSearchTool(mock_vector_store)
-        
+    @pytest.mark.parametrize("filters,expected_message", [
+        ({}, "No relevant content found"),
+        ({"course_name": "Python Programming"}, "No relevant content found in course 'Python Programming'"),
+        ({"lesson_number": 5}, "No relevant content found in lesson 5"),
+    ], ids=["no_filter", "course", "lesson"])
+    @pytest.mark.parametrize("configured_store", ["empty"], indirect=True)
+    def test_empty_search_results(self, search_tool, configured_store, filters, expected_message):
+        """Test empty results report the active filters"""
         # Execute
-        result = tool.execute(
-            query="nonexistent topic",
-            lesson_number=5
-        )
+        result = search_tool.execute(query="nonexistent topic", **filters)
         
         # Verify
-        assert "No relevant content found in lesson 5" in result
+        assert expected_message in result
+        _assert_no_sources(search_tool)
     
-    def test_search_error_handling(self, mock_vector_store, error_search_results):
+    @pytest.mark.parametrize("configured_store", ["error"], indirect=True)
+    def test_search_error_handling(self, search_tool, configured_store):
         """Test handling of search errors"""
-        # Setup
-        mock_vector_store.search.return_value = error_search_results
-        
-        tool = CourseSearchTool(mock_vector_store)
-        
         # Execute
-        result = tool.execute(query="test query")
+        result = search_tool.execute(query="test query")
         
         # Verify
         assert "Search error: ChromaDB connection failed" in result
-        assert tool.last_sources == []
+        _assert_no_sources(search_tool)
     
-    def test_tool_definition(self, mock_vector_store):
+    def test_tool_definition(self, search_tool):
         """Test that tool definition is properly formatted"""
-        tool = CourseSearchTool(mock_vector_store)
-        definition = tool.get_tool_definition()
-        
-        # Verify structure
-        assert definition["name"] == "search_course_content"
-        assert "description" in definition
-        assert "input_schema" in definition
-        
-        # Verify schema
-        schema = definition["input_schema"]
-        assert schema["type"] == "object"
-        assert "query" in schema["properties"]
-        assert "course_name" in schema["properties"]
-        assert "lesson_number" in schema["properties"]
-        assert schema["required"] == ["query"]
+        assert search_tool.get_tool_definition() == EXPECTED_SEARCH_TOOL_DEF
     
-    def test_format_results_with_lesson_links(self, mock_vector_store):
+    def test_format_results_with_lesson_links(self, search_tool, fake_vector_store):
         """Test result formatting includes lesson links when available"""
         # Setup search results
-        results = SearchResults(
-            documents=["Sample content about Python"],
-            metadata=[{"course_title": "Python Basics", "lesson_number": 1}],
-            distances=[0.1]
-        )
-        
-        mock_vector_store.search.return_value = results
-        mock_vector_store.get_lesson_link.return_value = "https://example.com/lesson1"
-        
-        tool = CourseSearchTool(mock_vector_store)
+        fake_vector_store.search_return = _build_results("Python Basics", 1)
+        fake_vector_store.lesson_link = "https://example.com/lesson1"
         
         # Execute
-        result = tool.execute(query="Python")
+        result = search_tool.execute(query="Python")
         
         # Verify
         assert "[Python Basics - Lesson 1]" in result
-        assert len(tool.last_sources) == 1
-        assert "https://example.com/lesson1" in tool.last_sources[0]
+        assert len(search_tool.last_sources) == 1
+        assert "https://example.com/lesson1" in search_tool.last_sources[0]
     
-    def test_format_results_without_lesson_number(self, mock_vector_store):
+    def test_format_results_without_lesson_number(self, search_tool, fake_vector_store):
         """Test result formatting when lesson_number is None"""
         # Setup search results without lesson number
-        results = SearchResults(
-            documents=["Sample content about Python"],
-            metadata=[{"course_title": "Python Basics", "lesson_number": None}],
-            distances=[0.1]
-        )
-        
-        mock_vector_store.search.return_value = results
-        
-        tool = CourseSearchTool(mock_vector_store)
+        fake_vector_store.search_return = _build_results("Python Basics")
         
         # Execute
-        result = tool.execute(query="Python")
+        result = search_tool.execute(query="Python")
         
         # Verify - should not include lesson info
         assert "[Python Basics]" in result
         assert "Lesson" not in result
     
-    def test_sources_reset_between_searches(self, mock_vector_store, successful_search_results):
+    def test_sources_reset_between_searches(self, search_tool, configured_store):
         """Test that sources are properly reset between searches"""
         # Setup
-        mock_vector_store.search.return_value = successful_search_results
-        mock_vector_store.get_lesson_link.return_value = "https://example.com/lesson1"
-        
-        tool = CourseSearchTool(mock_vector_store)
+        configured_store.lesson_link = "https://example.com/lesson1"
         
         # First search
-        tool.execute(query="First query")
-        first_sources = tool.last_sources.copy()
-        assert len(first_sources) > 0  # Verify we have sources from first search
+        search_tool.execute(query="First query")
+        first_len = len(search_tool.last_sources)
+        assert first_len > 0  # Verify we have sources from first search
         
         # Second search with empty results
         empty_results = SearchResults([], [], [])
-        mock_vector_store.search.return_value = empty_results
-        tool.execute(query="Second query")
+        configured_store.search_return = empty_results
+        search_tool.execute(query="Second query")
         
         # Verify sources were reset (empty results should clear sources)
-        assert tool.last_sources != first_sources
-        assert tool.last_sources == []
+        assert len(search_tool.last_sources) != first_len
+        _assert_no_sources(search_tool)
 
 
 class TestCourseOutlineTool:
     """Test suite for CourseOutlineTool"""
     
-    def test_successful_outline_retrieval(self, mock_vector_store):
+    @pytest.fixture(scope="class")
+    @classmethod
+    def outline_tool(cls, shared_vector_store):
+        """Build the stateless outline tool once for the class"""
+        return CourseOutlineTool(shared_vector_store)
+    
+    def test_successful_outline_retrieval(self, outline_tool, fake_vector_store):
         """Test successful course outline retrieval"""
         # Setup mock responses
-        mock_vector_store._resolve_course_name.return_value = "Python Programming Basics"
+        fake_vector_store.resolved_course_name = "Python Programming Basics"
         
-        # Mock course catalog response - ensure the get method returns the expected structure
+        # Stub course catalog response - ensure the get method returns the expected structure
         mock_results = {
             'metadatas': [{
                 'course_link': 'https://example.com/course',
                 'lessons_json': '[{"lesson_number": 1, "lesson_title": "Introduction"}, {"lesson_number": 2, "lesson_title": "Variables"}]'
             }]
         }
-        # Properly mock the course_catalog.get method
-        mock_vector_store.course_catalog.get.return_value = mock_results
-        
-        tool = CourseOutlineTool(mock_vector_store)
+        # Return it from the stubbed course_catalog.get
+        fake_vector_store.course_catalog.get_return = mock_results
         
         # Execute
-        result = tool.execute(course_name="Python Programming")
+        result = outline_tool.execute(course_name="Python Programming")
         
         # Verify
         assert "**Course**: Python Programming Basics" in result
@@ -279,46 +243,47 @@ class TestCourseOutlineTool:
         assert "2. Variables" in result
         
         # Verify the method calls were made correctly
-        mock_vector_store._resolve_course_name.assert_called_once_with("Python Programming")
-        mock_vector_store.course_catalog.get.assert_called_once_with(ids=["Python Programming Basics"])
+        assert fake_vector_store.resolve_calls == ["Python Programming"]
+        assert fake_vector_store.course_catalog.get_calls == [{"ids": ["Python Programming Basics"]}]
     
-    def test_course_not_found(self, mock_vector_store):
+    def test_course_not_found(self, outline_tool, fake_vector_store):
         """Test handling when course is not found"""
         # Setup
-        mock_vector_store._resolve_course_name.return_value = None
-        
-        tool = CourseOutlineTool(mock_vector_store)
+        fake_vector_store.resolved_course_name = None
         
         # Execute
-        result = tool.execute(course_name="Nonexistent Course")
+        result = outline_tool.execute(course_name="Nonexistent Course")
         
         # Verify
         assert "No course found matching 'Nonexistent Course'" in result
     
-    def test_outline_tool_definition(self, mock_vector_store):
+    def test_outline_tool_definition(self, outline_tool):
         """Test that outline tool definition is properly formatted"""
-        tool = CourseOutlineTool(mock_vector_store)
-        definition = tool.get_tool_definition()
-        
-        # Verify structure
-        assert definition["name"] == "get_course_outline"
-        assert "description" in definition
-        assert "input_schema" in definition
-        
-        # Verify schema
-        schema = definition["input_schema"]
-        assert schema["type"] == "object"
-        assert "course_name" in schema["properties"]
-        assert schema["required"] == ["course_name"]
+        assert outline_tool.get_tool_definition() == EXPECTED_OUTLINE_TOOL_DEF
 
 
 class TestToolManager:
     """Test suite for ToolManager"""
     
-    def test_tool_registration(self, mock_vector_store):
+    @pytest.fixture(scope="class")
+    @classmethod
+    def shared_manager(cls, shared_vector_store):
+        """Register the search and outline tools once for the class"""
+        manager = ToolManager()
+        manager.register_tool(CourseSearchTool(shared_vector_store))
+        manager.register_tool(CourseOutlineTool(shared_vector_store))
+        return manager
+    
+    @pytest.fixture
+    def registered_manager(self, shared_manager, fake_vector_store):
+        """The class-shared manager with its store reset and search sources cleared"""
+        shared_manager.tools["search_course_content"].last_sources = []
+        return shared_manager
+    
+    def test_tool_registration(self, fake_vector_store):
         """Test tool registration functionality"""
         manager = ToolManager()
-        search_tool = CourseSearchTool(mock_vector_store)
+        search_tool = CourseSearchTool(fake_vector_store)
         
         # Register tool
         manager.register_tool(search_tool)
@@ -327,17 +292,10 @@ class TestToolManager:
         assert "search_course_content" in manager.tools
         assert manager.tools["search_course_content"] == search_tool
     
-    def test_get_tool_definitions(self, mock_vector_store):
+    def test_get_tool_definitions(self, registered_manager):
         """Test retrieving all tool definitions"""
-        manager = ToolManager()
-        search_tool = CourseSearchTool(mock_vector_store)
-        outline_tool = CourseOutlineTool(mock_vector_store)
-        
-        manager.register_tool(search_tool)
-        manager.register_tool(outline_tool)
-        
         # Get definitions
-        definitions = manager.get_tool_definitions()
+        definitions = registered_manager.get_tool_definitions()
         
         # Verify
         assert len(definitions) == 2
@@ -345,23 +303,16 @@ class TestToolManager:
         assert "search_course_content" in tool_names
         assert "get_course_outline" in tool_names
     
-    def test_execute_tool(self, mock_vector_store, successful_search_results):
+    def test_execute_tool(self, registered_manager, configured_store):
         """Test tool execution through manager"""
-        # Setup
-        mock_vector_store.search.return_value = successful_search_results
-        
-        manager = ToolManager()
-        search_tool = CourseSearchTool(mock_vector_store)
-        manager.register_tool(search_tool)
-        
         # Execute
-        result = manager.execute_tool("search_course_content", query="test")
+        result = registered_manager.execute_tool("search_course_content", query="test")
         
         # Verify
         assert result != ""
         assert "Python Programming Basics" in result
     
-    def test_execute_nonexistent_tool(self, mock_vector_store):
+    def test_execute_nonexistent_tool(self, fake_vector_store):
         """Test executing nonexistent tool returns error"""
         manager = ToolManager()
         
@@ -371,42 +322,47 @@ class TestToolManager:
         # Verify
         assert "Tool 'nonexistent_tool' not found" in result
     
-    def test_get_last_sources(self, mock_vector_store, successful_search_results):
+    def test_get_last_sources(self, registered_manager, configured_store):
         """Test retrieving sources from last search"""
-        # Setup
-        mock_vector_store.search.return_value = successful_search_results
-        
-        manager = ToolManager()
-        search_tool = CourseSearchTool(mock_vector_store)
-        manager.register_tool(search_tool)
-        
         # Execute search to generate sources
-        manager.execute_tool("search_course_content", query="test")
+        registered_manager.execute_tool("search_course_content", query="test")
         
         # Get sources
-        sources = manager.get_last_sources()
+        sources = registered_manager.get_last_sources()
         
         # Verify
         assert len(sources) > 0
-        assert any("Python Programming Basics" in source for source in sources)
+        assert "Python Programming Basics" in "\n".join(sources)
     
-    def test_reset_sources(self, mock_vector_store, successful_search_results):
+    def test_reset_sources(self, registered_manager, configured_store):
         """Test sources reset functionality"""
-        # Setup
-        mock_vector_store.search.return_value = successful_search_results
-        
-        manager = ToolManager()
-        search_tool = CourseSearchTool(mock_vector_store)
-        manager.register_tool(search_tool)
-        
         # Execute search to generate sources
-        manager.execute_tool("search_course_content", query="test")
+        registered_manager.execute_tool("search_course_content", query="test")
         
         # Verify sources exist
-        assert len(manager.get_last_sources()) > 0
+        assert len(registered_manager.get_last_sources()) > 0
         
         # Reset sources
-        manager.reset_sources()
+        registered_manager.reset_sources()
         
         # Verify sources are cleared
-        assert len(manager.get_last_sources()) == 0
\ No newline at end of file
+        assert len(registered_manager.get_last_sources()) == 0
+    
+    def test_source_scope_isolates_concurrent_requests(self):
+        """Test interleaved requests each read back only their own search's sources"""
+        manager = ToolManager()
+        manager.register_tool(CourseSearchTool(QueryEchoStore()))
+        
+        async def handle(query: str, delay: float):
+            with source_scope():
+                await asyncio.to_thread(manager.execute_tool, "search_course_content", query=query)
+                # Yield so the other request runs its search before this one reads sources
+                await asyncio.sleep(delay)
+                return manager.get_last_sources()
+        
+        async def main():
+            return await asyncio.gather(handle("Course A", 0.02), handle("Course B", 0))
+        
+        assert asyncio.run(main()) == [["Course A - Lesson 1"], ["Course B - Lesson 1"]]
+        # Nothing leaks out of the scopes
+        assert manager.get_last_sources() == []
@@ -1,3 +1,7 @@
+import asyncio
+import math
+import chromadb
+import numpy as np
 import pytest
 import tempfile
 import shutil
@@ -8,8 +12,12 @@ import os
 # Add backend to path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+import embedding_registry
 from vector_store import VectorStore, SearchResults
+from query_cache import QueryCache
+from semantic_cache import SemanticCache
 from models import Course, Lesson, CourseChunk
+from tests.stubs import HashEmbeddingFunction
 
 class TestSearchResults:
     """Test suite for SearchResults class"""
@@ -29,7 +37,8 @@ class TestSearchResults:
         # Verify
         assert results.documents == ['doc1', 'doc2']
         assert results.metadata == [{'course': 'Python'}, {'course': 'Java'}]
-        assert results.distances == [0.1, 0.2]
+        assert results.distances.dtype == np.float32
+        assert results.distances.tolist() == pytest.approx([0.1, 0.2])
         assert results.error is None
     
     def test_from_chroma_empty(self):
@@ -44,7 +53,7 @@ class TestSearchResults:
         
         assert results.documents == []
         assert results.metadata == []
-        assert results.distances == []
+        assert results.distances.tolist() == []
         assert results.error is None
     
     def test_empty_class_method(self):
@@ -54,7 +63,7 @@ class TestSearchResults:
         
         assert results.documents == []
         assert results.metadata == []
-        assert results.distances == []
+        assert results.distances.tolist() == []
         assert results.error == error_msg
     
     def test_is_empty_method(self):
@@ -66,6 +75,104 @@ class TestSearchResults:
         # Non-empty results
         non_empty_results = SearchResults(['doc1'], [{'meta': 'data'}], [0.1])
         assert non_empty_results.is_empty() is False
+    
+    def test_topk_and_filter_by_distance(self):
+        """Test vectorized top-k selection and distance thresholding"""
+        results = SearchResults(['a', 'b', 'c', 'd'], [{'i': 0}, {'i': 1}, {'i': 2}, {'i': 3}],
+                                [0.4, 0.1, 0.3, 0.2])
+        
+        top = results.topk(2)
+        assert top.documents == ['b', 'd']
+        assert top.metadata == [{'i': 1}, {'i': 3}]
+        assert top.distances.tolist() == pytest.approx([0.1, 0.2])
+        assert results.topk(10).documents == ['b', 'd', 'c', 'a']
+        
+        assert results.filter_by_distance(0.3).documents == ['b', 'c', 'd']
+        assert results.filter_by_distance(0.0).is_empty()
+    
+    def test_rerank_applies_boost(self):
+        """Test reranking orders by boosted distance and reports the boosted scores"""
+        results = SearchResults(['a', 'b', 'c'], [{}, {}, {}], [0.2, 0.3, 0.4])
+        
+        reranked = results.rerank([1.0, 0.5, 1.0])
+        
+        assert reranked.documents == ['b', 'a', 'c']
+        assert reranked.distances.tolist() == pytest.approx([0.15, 0.2, 0.4])
+    
+    def test_equality_includes_distances(self):
+        """Test results compare equal only when their distances match too"""
+        results = SearchResults(['a'], [{}], [0.1])
+        
+        assert results == SearchResults(['a'], [{}], [0.1])
+        assert results != SearchResults(['a'], [{}], [0.2])
+        assert results != SearchResults(['a'], [{}], [0.1], error="stale")
+
+
+class TestQueryCache:
+    """Test suite for the LRU+TTL QueryCache"""
+    
+    def test_lru_eviction(self):
+        """Test the least recently used entry is evicted when full"""
+        cache = QueryCache(max_size=2, ttl_seconds=60)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")  # "b" is now least recently used
+        cache.put("c", 3)
+        
+        assert cache.get("a") == 1
+        assert cache.get("b") is None
+        assert cache.get("c") == 3
+        assert cache.stats() == {"size": 2, "hits": 3, "misses": 1}
+    
+    def test_ttl_expiry(self):
+        """Test entries expire once their TTL has passed"""
+        cache = QueryCache(max_size=10, ttl_seconds=5)
+        
+        with patch('query_cache.time.monotonic', return_value=100.0):
+            cache.put("key", "value")
+        with patch('query_cache.time.monotonic', return_value=104.0):
+            assert cache.get("key") == "value"
+        with patch('query_cache.time.monotonic', return_value=105.0):
+            assert cache.get("key") is None
+        assert cache.stats()["size"] == 0
+
+
+class TestSemanticCache:
+    """Test suite for the embedding-similarity SemanticCache"""
+    
+    def test_similar_embedding_hits_only_with_same_filters(self):
+        """Test a near-identical embedding hits while other filters or directions miss"""
+        cache = SemanticCache(threshold=0.97, max_size=4)
+        cache.add([1.0, 0.0, 0.0], ("course", None, 5), "result")
+        
+        assert cache.lookup([2.0, 0.01, 0.0], ("course", None, 5)) == "result"
+        assert cache.lookup([1.0, 0.0, 0.0], ("other", None, 5)) is None
+        assert cache.lookup([0.0, 1.0, 0.0], ("course", None, 5)) is None
+    
+    def test_int8_fingerprints_respect_threshold(self):
+        """Test int8 storage keeps cosine similarity accurate enough for the threshold"""
+        rng = np.random.default_rng(0)
+        base = rng.normal(size=384)
+        cache = SemanticCache(threshold=0.97)
+        cache.add(base, None, "result")
+        
+        assert cache._fp_matrix.dtype == np.int8
+        # Perturbations with true cosine similarity ~0.99 and ~0.91 respectively
+        assert cache.lookup(base + rng.normal(size=384) * 0.15, None) == "result"
+        assert cache.lookup(base + rng.normal(size=384) * 0.5, None) is None
+    
+    def test_fifo_eviction_and_invalidate(self):
+        """Test the oldest entry is overwritten when full and invalidate empties the cache"""
+        cache = SemanticCache(max_size=2)
+        cache.add([1.0, 0.0, 0.0], None, "x")
+        cache.add([0.0, 1.0, 0.0], None, "y")
+        cache.add([0.0, 0.0, 1.0], None, "z")
+        
+        assert cache.lookup([1.0, 0.0, 0.0], None) is None
+        assert cache.lookup([0.0, 0.0, 1.0], None) == "z"
+        
+        cache.invalidate()
+        assert cache.lookup([0.0, 1.0, 0.0], None) is None
 
 
 class TestVectorStore:
@@ -78,9 +185,12 @@ class TestVectorStore:
         yield temp_dir
         shutil.rmtree(temp_dir, ignore_errors=True)
     
-    @pytest.fixture
-    def mock_chroma_client(self):
-        """Create mock ChromaDB client"""
+    @pytest.fixture(scope="module")
+    @classmethod
+    def mock_chroma_client(cls):
+        """Create mock ChromaDB client, patched once for the whole module"""
+        # The shared model registry must never hand a mock to stores outside this module
+        embedding_registry.clear()
         with patch('chromadb.PersistentClient') as mock_client_class, \
              patch('chromadb.utils.embedding_functions.SentenceTransformerEmbeddingFunction') as mock_embedding:
             
@@ -91,24 +201,60 @@ class TestVectorStore:
             mock_embedding_instance = Mock()
             mock_embedding.return_value = mock_embedding_instance
             
-            # Mock collections
+            # Mock collections, looked up by name so any number of stores can be built
             mock_catalog = Mock()
             mock_content = Mock()
-            mock_client.get_or_create_collection.side_effect = [mock_catalog, mock_content]
+            collections = {"course_catalog": mock_catalog, "course_content": mock_content}
+            mock_client.get_or_create_collection.side_effect = lambda name, **kwargs: collections[name]
             
             yield mock_client, mock_catalog, mock_content
+        embedding_registry.clear()
+    
+    @pytest.fixture(scope="module")
+    @classmethod
+    def shared_store(cls, mock_chroma_client, tmp_path_factory):
+        """One VectorStore over the mocked client, reused by tests with default settings"""
+        return VectorStore(str(tmp_path_factory.mktemp("chroma")), "test-model")
+    
+    @pytest.fixture(autouse=True)
+    def reset_shared_store(self, mock_chroma_client, shared_store):
+        """Give every test fresh mocks and empty caches"""
+        mock_client, mock_catalog, mock_content = mock_chroma_client
+        mock_client.reset_mock()
+        mock_catalog.reset_mock(return_value=True, side_effect=True)
+        mock_content.reset_mock(return_value=True, side_effect=True)
+        shared_store.embedding_function.reset_mock()
+        shared_store._invalidate_caches()
     
     def test_init(self, mock_chroma_client, temp_chroma_path):
         """Test VectorStore initialization"""
         mock_client, mock_catalog, mock_content = mock_chroma_client
         
+        embedding_registry.clear()
+        mock_embedding_class = chromadb.utils.embedding_functions.SentenceTransformerEmbeddingFunction
+        mock_embedding_class.reset_mock()
+        
         store = VectorStore(temp_chroma_path, "test-model", max_results=3)
+        other_store = VectorStore(temp_chroma_path, "test-model")
         
         assert store.max_results == 3
         assert store.course_catalog == mock_catalog
         assert store.course_content == mock_content
+        
+        # Stores for the same model share one loaded embedding function
+        assert other_store.embedding_function is store.embedding_function
+        mock_embedding_class.assert_called_once()
+    
+    def test_init_warmup_queries_chroma(self, mock_chroma_client, temp_chroma_path):
+        """Test warmup=True issues one tiny query against each collection during init"""
+        mock_client, mock_catalog, mock_content = mock_chroma_client
+        
+        VectorStore(temp_chroma_path, "test-model", warmup=True)
+        
+        mock_catalog.get.assert_called_once_with(limit=1)
+        mock_content.query.assert_called_once_with(query_texts=["warmup"], n_results=1)
     
-    def test_search_success(self, mock_chroma_client, temp_chroma_path):
+    def test_search_success(self, mock_chroma_client, shared_store):
         """Test successful search operation"""
         mock_client, mock_catalog, mock_content = mock_chroma_client
         
@@ -119,7 +265,7 @@ class TestVectorStore:
             'distances': [[0.1]]
         }
         
-        store = VectorStore(temp_chroma_path, "test-model")
+        store = shared_store
         
         # Execute
         results = store.search("What is Python?")
@@ -137,7 +283,7 @@ class TestVectorStore:
             where=None
         )
     
-    def test_search_with_course_filter(self, mock_chroma_client, temp_chroma_path):
+    def test_search_with_course_filter(self, mock_chroma_client, shared_store):
         """Test search with course name filter"""
         mock_client, mock_catalog, mock_content = mock_chroma_client
         
@@ -150,7 +296,7 @@ class TestVectorStore:
                 'distances': [[0.1]]
             }
             
-            store = VectorStore(temp_chroma_path, "test-model")
+            store = shared_store
             
             # Execute
             results = store.search("test query", course_name="Python")
@@ -161,7 +307,7 @@ class TestVectorStore:
             args, kwargs = mock_content.query.call_args
             assert kwargs['where'] == {'course_title': 'Python Basics'}
     
-    def test_search_with_lesson_filter(self, mock_chroma_client, temp_chroma_path):
+    def test_search_with_lesson_filter(self, mock_chroma_client, shared_store):
         """Test search with lesson number filter"""
         mock_client, mock_catalog, mock_content = mock_chroma_client
         
@@ -171,7 +317,7 @@ class TestVectorStore:
             'distances': [[0.1]]
         }
         
-        store = VectorStore(temp_chroma_path, "test-model")
+        store = shared_store
         
         # Execute
         results = store.search("test query", lesson_number=1)
@@ -182,7 +328,7 @@ class TestVectorStore:
         args, kwargs = mock_content.query.call_args
         assert kwargs['where'] == {'lesson_number': 1}
     
-    def test_search_with_both_filters(self, mock_chroma_client, temp_chroma_path):
+    def test_search_with_both_filters(self, mock_chroma_client, shared_store):
         """Test search with both course and lesson filters"""
         mock_client, mock_catalog, mock_content = mock_chroma_client
         
@@ -193,7 +339,7 @@ class TestVectorStore:
                 'distances': [[0.1]]
             }
             
-            store = VectorStore(temp_chroma_path, "test-model")
+            store = shared_store
             
             # Execute
             results = store.search("test query", course_name="Python", lesson_number=2)
@@ -210,12 +356,12 @@ class TestVectorStore:
             }
             assert kwargs['where'] == expected_filter
     
-    def test_search_course_not_found(self, mock_chroma_client, temp_chroma_path):
+    def test_search_course_not_found(self, mock_chroma_client, shared_store):
         """Test search when course name cannot be resolved"""
         mock_client, mock_catalog, mock_content = mock_chroma_client
         
         with patch.object(VectorStore, '_resolve_course_name', return_value=None):
-            store = VectorStore(temp_chroma_path, "test-model")
+            store = shared_store
             
             # Execute
             results = store.search("test query", course_name="Nonexistent Course")
@@ -224,14 +370,14 @@ class TestVectorStore:
             assert results.is_empty()
             assert "No course found matching 'Nonexistent Course'" in results.error
     
-    def test_search_exception_handling(self, mock_chroma_client, temp_chroma_path):
+    def test_search_exception_handling(self, mock_chroma_client, shared_store):
         """Test search exception handling"""
         mock_client, mock_catalog, mock_content = mock_chroma_client
         
         # Mock query to raise exception
         mock_content.query.side_effect = Exception("ChromaDB error")
         
-        store = VectorStore(temp_chroma_path, "test-model")
+        store = shared_store
         
         # Execute
         results = store.search("test query")
@@ -240,7 +386,131 @@ class TestVectorStore:
         assert results.is_empty()
         assert "Search error: ChromaDB error" in results.error
     
-    def test_resolve_course_name_success(self, mock_chroma_client, temp_chroma_path):
+    def test_search_cache_hit(self, mock_chroma_client, shared_store):
+        """Test identical searches are served from the cache after the first query"""
+        mock_client, mock_catalog, mock_content = mock_chroma_client
+        
+        mock_content.query.return_value = {
+            'documents': [['Python is a programming language']],
+            'metadatas': [[{'course_title': 'Python Basics', 'lesson_number': 1}]],
+            'distances': [[0.1]]
+        }
+        
+        store = shared_store
+        
+        # Execute
+        first = store.search("What is Python?")
+        second = store.search("What is Python?")
+        
+        # Verify
+        assert mock_content.query.call_count == 1
+        assert second == first
+        
+        # Each hit is a copy, so one caller's edits don't leak into the next
+        second.documents.append("injected")
+        second.metadata[0]['lesson_number'] = 99
+        second.distances[0] = 0.9
+        assert store.search("What is Python?") == first
+        
+        # A different limit is a different search
+        store.search("What is Python?", limit=1)
+        assert mock_content.query.call_count == 2
+    
+    def test_search_cache_invalidated_by_writes(self, mock_chroma_client, shared_store, sample_course_chunks):
+        """Test adding content drops cached results and errors are never cached"""
+        mock_client, mock_catalog, mock_content = mock_chroma_client
+        
+        mock_content.query.side_effect = [
+            Exception("ChromaDB error"),
+            {'documents': [['old']], 'metadatas': [[{}]], 'distances': [[0.1]]},
+            {'documents': [['new']], 'metadatas': [[{}]], 'distances': [[0.1]]}
+        ]
+        
+        store = shared_store
+        
+        # Errors are retried on the next call
+        assert store.search("test query").error == "Search error: ChromaDB error"
+        assert store.search("test query").documents == ['old']
+        
+        # Writes invalidate the cache
+        store.add_course_content(sample_course_chunks)
+        assert store.search("test query").documents == ['new']
+        assert mock_content.query.call_count == 3
+    
+    def test_asearch_returns_same_as_search(self, mock_chroma_client, shared_store):
+        """Test the async wrapper returns what search() returns for the same arguments"""
+        mock_client, mock_catalog, mock_content = mock_chroma_client
+        mock_content.query.return_value = {
+            'documents': [['doc']], 'metadatas': [[{'lesson_number': 2}]], 'distances': [[0.1]]
+        }
+        
+        result = asyncio.run(shared_store.asearch("query", lesson_number=2))
+        
+        assert result == shared_store.search("query", lesson_number=2)
+        assert result.documents == ['doc']
+        mock_content.query.assert_called_once_with(
+            query_texts=["query"], n_results=5, where={"lesson_number": 2}
+        )
+    
+    def test_batch_search_single_call(self, mock_chroma_client, shared_store):
+        """Test several queries are answered by one content query"""
+        mock_client, mock_catalog, mock_content = mock_chroma_client
+        mock_content.query.return_value = {
+            'documents': [['a1'], ['b1']],
+            'metadatas': [[{'lesson_number': 1}], [{'lesson_number': 2}]],
+            'distances': [[0.1], [0.2]]
+        }
+        
+        store = shared_store
+        
+        first, second = store.batch_search(["query a", "query b"], lesson_number=1)
+        
+        assert first.documents == ['a1']
+        assert second.documents == ['b1']
+        assert second.distances.tolist() == pytest.approx([0.2])
+        mock_content.query.assert_called_once_with(
+            query_texts=["query a", "query b"],
+            n_results=5,
+            where={"lesson_number": 1}
+        )
+    
+    def test_batch_search_partial_cache_hit(self, mock_chroma_client, shared_store):
+        """Test only uncached queries are sent in the batch call"""
+        mock_client, mock_catalog, mock_content = mock_chroma_client
+        mock_content.query.side_effect = [
+            {'documents': [['cached']], 'metadatas': [[{}]], 'distances': [[0.1]]},
+            {'documents': [['fresh']], 'metadatas': [[{}]], 'distances': [[0.3]]}
+        ]
+        
+        store = shared_store
+        store.search("seen query")
+        
+        results = store.batch_search(["seen query", "new query"])
+        
+        assert [r.documents for r in results] == [['cached'], ['fresh']]
+        assert mock_content.query.call_count == 2
+        assert mock_content.query.call_args.kwargs["query_texts"] == ["new query"]
+    
+    def test_semantic_cache_reuses_paraphrased_query(self, mock_chroma_client, temp_chroma_path):
+        """Test near-duplicate queries share one Chroma query and are sent as embeddings"""
+        mock_client, mock_catalog, mock_content = mock_chroma_client
+        mock_content.query.return_value = {
+            'documents': [['doc']], 'metadatas': [[{}]], 'distances': [[0.1]]
+        }
+        
+        store = VectorStore(temp_chroma_path, "test-model",
+                            embedding_function=HashEmbeddingFunction(), semantic_cache=True)
+        
+        first = store.search("What is Python?")
+        assert store.search("what is PYTHON") == first
+        assert mock_content.query.call_count == 1
+        assert "query_embeddings" in mock_content.query.call_args.kwargs
+        
+        # Different filters never share cached results
+        store.search("what is python", limit=2)
+        assert mock_content.query.call_count == 2
+    
+    def test_resolve_course_name_success(self, mock_chroma_client, shared_store):
         """Test successful course name resolution"""
         mock_client, mock_catalog, mock_content = mock_chroma_client
         
@@ -250,7 +520,7 @@ class TestVectorStore:
             'metadatas': [[{'title': 'Python Programming Basics'}]]
         }
         
-        store = VectorStore(temp_chroma_path, "test-model")
+        store = shared_store
         
         # Execute
         result = store._resolve_course_name("Python")
@@ -262,7 +532,23 @@ class TestVectorStore:
             n_results=1
         )
     
-    def test_resolve_course_name_not_found(self, mock_chroma_client, temp_chroma_path):
+    def test_resolve_course_name_cached(self, mock_chroma_client, shared_store):
+        """Test repeated resolutions reuse the first catalog query but errors are retried"""
+        mock_client, mock_catalog, mock_content = mock_chroma_client
+        mock_catalog.query.side_effect = [
+            Exception("ChromaDB error"),
+            {'documents': [['Python Programming Basics']],
+             'metadatas': [[{'title': 'Python Programming Basics'}]]}
+        ]
+        
+        store = shared_store
+        
+        assert store._resolve_course_name("Python") is None
+        assert store._resolve_course_name("Python") == "Python Programming Basics"
+        assert store._resolve_course_name("Python") == "Python Programming Basics"
+        assert mock_catalog.query.call_count == 2
+    
+    def test_resolve_course_name_not_found(self, mock_chroma_client, shared_store):
         """Test course name resolution when not found"""
         mock_client, mock_catalog, mock_content = mock_chroma_client
         
@@ -272,7 +558,7 @@ class TestVectorStore:
             'metadatas': [[]]
         }
         
-        store = VectorStore(temp_chroma_path, "test-model")
+        store = shared_store
         
         # Execute
         result = store._resolve_course_name("Nonexistent")
@@ -280,34 +566,34 @@ class TestVectorStore:
         # Verify
         assert result is None
     
-    def test_build_filter_no_filters(self, mock_chroma_client, temp_chroma_path):
+    def test_build_filter_no_filters(self, mock_chroma_client, shared_store):
         """Test filter building with no filters"""
         mock_client, mock_catalog, mock_content = mock_chroma_client
-        store = VectorStore(temp_chroma_path, "test-model")
+        store = shared_store
         
         result = store._build_filter(None, None)
         assert result is None
     
-    def test_build_filter_course_only(self, mock_chroma_client, temp_chroma_path):
+    def test_build_filter_course_only(self, mock_chroma_client, shared_store):
         """Test filter building with course only"""
         mock_client, mock_catalog, mock_content = mock_chroma_client
-        store = VectorStore(temp_chroma_path, "test-model")
+        store = shared_store
         
         result = store._build_filter("Python Basics", None)
         assert result == {"course_title": "Python Basics"}
     
-    def test_build_filter_lesson_only(self, mock_chroma_client, temp_chroma_path):
+    def test_build_filter_lesson_only(self, mock_chroma_client, shared_store):
         """Test filter building with lesson only"""
         mock_client, mock_catalog, mock_content = mock_chroma_client
-        store = VectorStore(temp_chroma_path, "test-model")
+        store = shared_store
         
         result = store._build_filter(None, 1)
         assert result == {"lesson_number": 1}
     
-    def test_build_filter_both(self, mock_chroma_client, temp_chroma_path):
+    def test_build_filter_both(self, mock_chroma_client, shared_store):
         """Test filter building with both course and lesson"""
         mock_client, mock_catalog, mock_content = mock_chroma_client
-        store = VectorStore(temp_chroma_path, "test-model")
+        store = shared_store
         
         result = store._build_filter("Python Basics", 1)
         expected = {
@@ -318,10 +604,64 @@ class TestVectorStore:
         }
         assert result == expected
     
-    def test_add_course_metadata(self, mock_chroma_client, temp_chroma_path, sample_course):
+    def test_build_filter_list_courses(self, mock_chroma_client, shared_store):
+        """Test lists of courses or lessons become $in clauses"""
+        store = shared_store
+        
+        assert store._build_filter(["Python Basics", "Java Basics"], None) == {
+            "course_title": {"$in": ["Python Basics", "Java Basics"]}
+        }
+        assert store._build_filter("Python Basics", [1, 2]) == {
+            "$and": [
+                {"course_title": "Python Basics"},
+                {"lesson_number": {"$in": [1, 2]}}
+            ]
+        }
+    
+    def test_search_with_plural_filters(self, mock_chroma_client, shared_store):
+        """Test several courses and lessons are covered by one content query"""
+        mock_client, mock_catalog, mock_content = mock_chroma_client
+        mock_content.query.return_value = {
+            'documents': [['doc']], 'metadatas': [[{}]], 'distances': [[0.1]]
+        }
+        
+        with patch.object(VectorStore, '_resolve_course_name', side_effect=lambda name: f"{name} Course"):
+            shared_store.search("variables", course_names=["Python", "Java"], lesson_numbers=[1, 2])
+        
+        mock_content.query.assert_called_once_with(
+            query_texts=["variables"],
+            n_results=5,
+            where={"$and": [
+                {"course_title": {"$in": ["Python Course", "Java Course"]}},
+                {"lesson_number": {"$in": [1, 2]}}
+            ]}
+        )
+    
+    def test_batch_search_with_plural_filters(self, mock_chroma_client, shared_store):
+        """Test batch_search applies plural filters and shares cache entries with search"""
+        mock_client, mock_catalog, mock_content = mock_chroma_client
+        mock_content.query.return_value = {
+            'documents': [['doc']], 'metadatas': [[{}]], 'distances': [[0.1]]
+        }
+        
+        with patch.object(VectorStore, '_resolve_course_name', side_effect=lambda name: f"{name} Course"):
+            batched, = shared_store.batch_search(["variables"], course_names=["Python", "Java"], lesson_numbers=[1, 2])
+            single = shared_store.search("variables", course_names=["Python", "Java"], lesson_numbers=[1, 2])
+        
+        assert single == batched
+        mock_content.query.assert_called_once_with(
+            query_texts=["variables"],
+            n_results=5,
+            where={"$and": [
+                {"course_title": {"$in": ["Python Course", "Java Course"]}},
+                {"lesson_number": {"$in": [1, 2]}}
+            ]}
+        )
+    
+    def test_add_course_metadata(self, mock_chroma_client, shared_store, sample_course):
         """Test adding course metadata"""
         mock_client, mock_catalog, mock_content = mock_chroma_client
-        store = VectorStore(temp_chroma_path, "test-model")
+        store = shared_store
         
         # Execute
         store.add_course_metadata(sample_course)
@@ -341,10 +681,10 @@ class TestVectorStore:
         assert 'lessons_json' in metadata
         assert metadata['lesson_count'] == len(sample_course.lessons)
     
-    def test_add_course_content(self, mock_chroma_client, temp_chroma_path, sample_course_chunks):
+    def test_add_course_content(self, mock_chroma_client, shared_store, sample_course_chunks):
         """Test adding course content chunks"""
         mock_client, mock_catalog, mock_content = mock_chroma_client
-        store = VectorStore(temp_chroma_path, "test-model")
+        store = shared_store
         
         # Execute
         store.add_course_content(sample_course_chunks)
@@ -356,16 +696,58 @@ class TestVectorStore:
         assert len(kwargs['documents']) == len(sample_course_chunks)
         assert len(kwargs['metadatas']) == len(sample_course_chunks)
         assert len(kwargs['ids']) == len(sample_course_chunks)
+        assert kwargs['embeddings'] is store.embedding_function.return_value
+        store.embedding_function.assert_called_once_with(kwargs['documents'])
         
         # Verify first chunk
         assert kwargs['documents'][0] == sample_course_chunks[0].content
         assert kwargs['metadatas'][0]['course_title'] == sample_course_chunks[0].course_title
         assert kwargs['metadatas'][0]['lesson_number'] == sample_course_chunks[0].lesson_number
     
-    def test_add_course_content_empty_list(self, mock_chroma_client, temp_chroma_path):
+    def test_add_course_content_batches(self, mock_chroma_client, temp_chroma_path, sample_course_chunks):
+        """Test chunks are added in batches of add_batch_size"""
+        mock_client, mock_catalog, mock_content = mock_chroma_client
+        store = VectorStore(temp_chroma_path, "test-model", add_batch_size=2)
+        
+        store.add_course_content(sample_course_chunks)
+        
+        assert mock_content.add.call_count == math.ceil(len(sample_course_chunks) / 2)
+        added_ids = [id_ for c in mock_content.add.call_args_list for id_ in c.kwargs['ids']]
+        assert len(added_ids) == len(sample_course_chunks)
+        assert all(len(c.kwargs['documents']) <= 2 for c in mock_content.add.call_args_list)
+    
+    def test_bulk_ingest_defers_and_batches_adds(self, mock_chroma_client, temp_chroma_path, sample_course_chunks):
+        """Test adds inside bulk_ingest are written together in full batches on exit"""
+        mock_client, mock_catalog, mock_content = mock_chroma_client
+        store = VectorStore(temp_chroma_path, "test-model", add_batch_size=2)
+        
+        with store.bulk_ingest():
+            for chunk in sample_course_chunks:
+                store.add_course_content([chunk])
+            mock_content.add.assert_not_called()
+        
+        assert mock_content.add.call_count == math.ceil(len(sample_course_chunks) / 2)
+        assert sum(len(c.kwargs['ids']) for c in mock_content.add.call_args_list) == len(sample_course_chunks)
+    
+    def test_bulk_ingest_discards_buffer_on_error(self, mock_chroma_client, shared_store, sample_course_chunks):
+        """Test a failing bulk_ingest block writes nothing and re-raises its own error"""
+        mock_client, mock_catalog, mock_content = mock_chroma_client
+        
+        with pytest.raises(RuntimeError, match="parse failed"):
+            with shared_store.bulk_ingest():
+                shared_store.add_course_content(sample_course_chunks[:1])
+                raise RuntimeError("parse failed")
+        
+        mock_content.add.assert_not_called()
+        
+        # Buffering is off again, so later adds write immediately
+        shared_store.add_course_content(sample_course_chunks)
+        mock_content.add.assert_called_once()
+    
+    def test_add_course_content_empty_list(self, mock_chroma_client, shared_store):
         """Test adding empty course content list"""
         mock_client, mock_catalog, mock_content = mock_chroma_client
-        store = VectorStore(temp_chroma_path, "test-model")
+        store = shared_store
         
         # Execute
         store.add_course_content([])
@@ -373,11 +755,11 @@ class TestVectorStore:
         # Verify content.add was not called
         mock_content.add.assert_not_called()
     
-    def test_clear_all_data(self, mock_chroma_client, temp_chroma_path):
+    def test_clear_all_data(self, mock_chroma_client, shared_store):
         """Test clearing all data"""
         mock_client, mock_catalog, mock_content = mock_chroma_client
         
-        store = VectorStore(temp_chroma_path, "test-model")
+        store = shared_store
         
         # Execute
         store.clear_all_data()
@@ -387,12 +769,10 @@ class TestVectorStore:
         mock_client.delete_collection.assert_any_call("course_catalog")
         mock_client.delete_collection.assert_any_call("course_content")
         
-        # Verify get_or_create_collection was called again to recreate
-        # Should be called twice for initialization and twice for recreation
-        expected_calls = 4  # 2 initial + 2 recreate
-        assert mock_client.get_or_create_collection.call_count >= expected_calls - 1  # Allow for minor variation in mock setup
+        # Verify get_or_create_collection was called again to recreate both collections
+        assert mock_client.get_or_create_collection.call_count == 2
     
-    def test_get_existing_course_titles(self, mock_chroma_client, temp_chroma_path):
+    def test_get_existing_course_titles(self, mock_chroma_client, shared_store):
         """Test getting existing course titles"""
         mock_client, mock_catalog, mock_content = mock_chroma_client
         
@@ -401,16 +781,20 @@ class TestVectorStore:
             'ids': ['Course 1', 'Course 2', 'Course 3']
         }
         
-        store = VectorStore(temp_chroma_path, "test-model")
+        store = shared_store
         
         # Execute
         titles = store.get_existing_course_titles()
         
         # Verify
         assert titles == ['Course 1', 'Course 2', 'Course 3']
-        mock_catalog.get.assert_called_once()
+        
+        # Repeat calls are served from the cache and callers get their own copy
+        titles.append('Mutated')
+        assert store.get_existing_course_titles() == ['Course 1', 'Course 2', 'Course 3']
+        mock_catalog.get.assert_called_once_with(include=[])
     
-    def test_get_course_count(self, mock_chroma_client, temp_chroma_path):
+    def test_get_course_count(self, mock_chroma_client, shared_store):
         """Test getting course count"""
         mock_client, mock_catalog, mock_content = mock_chroma_client
         
@@ -419,15 +803,23 @@ class TestVectorStore:
             'ids': ['Course 1', 'Course 2']
         }
         
-        store = VectorStore(temp_chroma_path, "test-model")
+        store = shared_store
         
         # Execute
         count = store.get_course_count()
         
         # Verify
         assert count == 2
+        assert store.get_course_count() == 2
+        assert mock_catalog.get.call_count == 1
+        
+        # Adding a course drops the cached titles
+        store.add_course_metadata(Course(title="Course 3", lessons=[]))
+        mock_catalog.get.return_value = {'ids': ['Course 1', 'Course 2', 'Course 3']}
+        assert store.get_course_count() == 3
+        assert mock_catalog.get.call_count == 2
     
-    def test_get_lesson_link(self, mock_chroma_client, temp_chroma_path):
+    def test_get_lesson_link(self, mock_chroma_client, shared_store):
         """Test getting lesson link"""
         mock_client, mock_catalog, mock_content = mock_chroma_client
         
@@ -439,16 +831,19 @@ class TestVectorStore:
             }]
         }
         
-        store = VectorStore(temp_chroma_path, "test-model")
+        store = shared_store
         
         # Execute
         link = store.get_lesson_link("Test Course", 1)
         
         # Verify
         assert link == "https://example.com/lesson1"
+        
+        # Later lessons of the same course reuse the parsed mapping
+        assert store.get_lesson_link("Test Course", 2) == "https://example.com/lesson2"
         mock_catalog.get.assert_called_once_with(ids=["Test Course"])
     
-    def test_get_lesson_link_not_found(self, mock_chroma_client, temp_chroma_path):
+    def test_get_lesson_link_not_found(self, mock_chroma_client, shared_store):
         """Test getting lesson link when lesson not found"""
         mock_client, mock_catalog, mock_content = mock_chroma_client
         
@@ -460,10 +855,44 @@ class TestVectorStore:
             }]
         }
         
-        store = VectorStore(temp_chroma_path, "test-model")
+        store = shared_store
         
         # Execute - request lesson 2 which doesn't exist
         link = store.get_lesson_link("Test Course", 2)
         
         # Verify
-        assert link is None
\ No newline at end of file
+        assert link is None
+        assert store.get_lesson_link("Test Course", 3) is None
+        assert mock_catalog.get.call_count == 1
+        
+        # New metadata drops the memoized mapping
+        store.add_course_metadata(Course(title="Other Course", lessons=[]))
+        store.get_lesson_link("Test Course", 2)
+        assert mock_catalog.get.call_count == 2
+
+@pytest.mark.integration
+class TestVectorStoreInMemory:
+    """Test VectorStore against a real in-process ChromaDB client"""
+    
+    def test_search_filters_by_lesson(self, in_memory_vector_store):
+        """Test filtered search returns only chunks from the requested lesson"""
+        results = in_memory_vector_store.search("variables data types", lesson_number=2)
+        
+        assert results.error is None
+        assert len(results.documents) == 1
+        assert "Variables in Python" in results.documents[0]
+        assert results.metadata[0]["lesson_number"] == 2
+    
+    def test_search_resolves_course_name(self, in_memory_vector_store):
+        """Test partial course names resolve through the catalog collection"""
+        results = in_memory_vector_store.search("Python", course_name="Python Programming")
+        
+        assert results.error is None
+        assert all(meta["course_title"] == "Python Programming Basics" for meta in results.metadata)
+    
+    def test_catalog_queries(self, in_memory_vector_store):
+        """Test catalog helpers read back the stored course metadata"""
+        assert in_memory_vector_store.get_existing_course_titles() == ["Python Programming Basics"]
+        assert in_memory_vector_store.get_course_count() == 1
+        assert in_memory_vector_store.get_course_link("Python Programming Basics") == "https://example.com/course"
+        assert in_memory_vector_store.get_lesson_link("Python Programming Basics", 2) == "https://example.com/lesson2"
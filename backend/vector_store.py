@@ -1,25 +1,45 @@
+import asyncio
+import functools
+from contextlib import contextmanager
 import chromadb
+import numpy as np
+import orjson
 from chromadb.config import Settings
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Sequence, Tuple, Union
 from dataclasses import dataclass
 from models import Course, CourseChunk
-from sentence_transformers import SentenceTransformer
+from embedding_registry import get_embedding_fn
+from query_cache import QueryCache
+from semantic_cache import SemanticCache
 
 @dataclass
 class SearchResults:
     """Container for search results with metadata"""
     documents: List[str]
     metadata: List[Dict[str, Any]]
-    distances: List[float]
+    # Stored as a float32 array so ranking and thresholds are vectorized
+    distances: np.ndarray
     error: Optional[str] = None
     
+    def __post_init__(self):
+        self.distances = np.asarray(self.distances, dtype=np.float32)
+    
+    def __eq__(self, other):
+        # Arrays compare elementwise, so the generated __eq__ can't be used
+        if not isinstance(other, SearchResults):
+            return NotImplemented
+        return (self.documents == other.documents
+                and self.metadata == other.metadata
+                and self.error == other.error
+                and np.array_equal(self.distances, other.distances))
+    
     @classmethod
-    def from_chroma(cls, chroma_results: Dict) -> 'SearchResults':
-        """Create SearchResults from ChromaDB query results"""
+    def from_chroma(cls, chroma_results: Dict, index: int = 0) -> 'SearchResults':
+        """Create SearchResults from ChromaDB query results (index selects the query in a batch)"""
         return cls(
-            documents=chroma_results['documents'][0] if chroma_results['documents'] else [],
-            metadata=chroma_results['metadatas'][0] if chroma_results['metadatas'] else [],
-            distances=chroma_results['distances'][0] if chroma_results['distances'] else []
+            documents=chroma_results['documents'][index] if chroma_results['documents'] else [],
+            metadata=chroma_results['metadatas'][index] if chroma_results['metadatas'] else [],
+            distances=chroma_results['distances'][index] if chroma_results['distances'] else []
         )
     
     @classmethod
@@ -27,29 +47,101 @@ class SearchResults:
         """Create empty results with error message"""
         return cls(documents=[], metadata=[], distances=[], error=error_msg)
     
+    def copy(self) -> 'SearchResults':
+        """Independent copy, so callers can't alter a result another caller shares"""
+        return SearchResults(
+            documents=list(self.documents),
+            metadata=[dict(meta) if meta else meta for meta in self.metadata],
+            distances=self.distances.copy(),
+            error=self.error
+        )
+    
     def is_empty(self) -> bool:
         """Check if results are empty"""
         return len(self.documents) == 0
+    
+    def _select(self, indices: np.ndarray) -> 'SearchResults':
+        """New SearchResults holding only the given result positions, in order"""
+        return SearchResults(
+            documents=[self.documents[i] for i in indices],
+            metadata=[self.metadata[i] for i in indices],
+            distances=self.distances[indices],
+            error=self.error
+        )
+    
+    def topk(self, n: int) -> 'SearchResults':
+        """The n closest results, nearest first"""
+        if n >= len(self.distances):
+            return self._select(np.argsort(self.distances, kind="stable"))
+        if n <= 0:
+            return self._select(np.arange(0))
+        nearest = np.argpartition(self.distances, n - 1)[:n]
+        return self._select(nearest[np.argsort(self.distances[nearest], kind="stable")])
+    
+    def filter_by_distance(self, max_distance: float) -> 'SearchResults':
+        """Results whose distance is at most max_distance, in their original order"""
+        return self._select(np.flatnonzero(self.distances <= max_distance))
+    
+    def rerank(self, lesson_boost: np.ndarray) -> 'SearchResults':
+        """Reorder by distance times a per-result boost (< 1 favors a result), nearest first
+        
+        The returned distances are the boosted scores, so topk and filter_by_distance
+        apply to them.
+        """
+        scores = self.distances * np.asarray(lesson_boost, dtype=np.float32)
+        order = np.argsort(scores, kind="stable")
+        reranked = self._select(order)
+        reranked.distances = scores[order]
+        return reranked
 
 class VectorStore:
     """Vector storage using ChromaDB for course content and metadata"""
     
-    def __init__(self, chroma_path: str, embedding_model: str, max_results: int = 5):
+    # Bounds for the search result cache; any write to the collections invalidates it
+    SEARCH_CACHE_SIZE = 2000
+    SEARCH_CACHE_TTL = 300  # seconds
+    LESSON_MAP_CACHE_SIZE = 512
+    COURSE_NAME_CACHE_SIZE = 256
+    
+    def __init__(self, chroma_path: str, embedding_model: str, max_results: int = 5,
+                 client=None, embedding_function=None, semantic_cache: bool = False,
+                 add_batch_size: int = 100, warmup: bool = False):
         self.max_results = max_results
-        # Initialize ChromaDB client
-        self.client = chromadb.PersistentClient(
+        self.add_batch_size = add_batch_size  # Chroma recommends 100-250 records per add
+        self._cache = QueryCache(max_size=self.SEARCH_CACHE_SIZE, ttl_seconds=self.SEARCH_CACHE_TTL)
+        # Opt-in: also reuse results for near-duplicate (paraphrased) queries
+        self._semantic_cache = SemanticCache() if semantic_cache else None
+        # Per-instance memo of each course's lesson number -> link mapping
+        self._get_lesson_map = functools.lru_cache(maxsize=self.LESSON_MAP_CACHE_SIZE)(self._load_lesson_map)
+        # ...and of raw course name -> resolved title, which every filtered search needs
+        self._get_course_title = functools.lru_cache(maxsize=self.COURSE_NAME_CACHE_SIZE)(self._query_course_title)
+        self._titles_cache: Optional[List[str]] = None  # Catalog ids, loaded on first use
+        self._pending_chunks: Optional[List[CourseChunk]] = None  # Set inside bulk_ingest()
+        # Initialize ChromaDB client (an injected client, e.g. EphemeralClient, skips disk)
+        self.client = client if client is not None else chromadb.PersistentClient(
             path=chroma_path,
             settings=Settings(anonymized_telemetry=False)
         )
         
-        # Set up sentence transformer embedding function
-        self.embedding_function = chromadb.utils.embedding_functions.SentenceTransformerEmbeddingFunction(
-            model_name=embedding_model
-        )
+        # Set up sentence transformer embedding function unless one is injected; stores
+        # using the same model share one loaded instance
+        self.embedding_function = embedding_function or get_embedding_fn(embedding_model)
         
         # Create collections for different types of data
         self.course_catalog = self._create_collection("course_catalog")  # Course titles/instructors
         self.course_content = self._create_collection("course_content")  # Actual course material
+        
+        if warmup:
+            self._warmup()
+    
+    def _warmup(self):
+        """Touch both collections (and the embedder) so the first real query starts warm"""
+        try:
+            self.course_catalog.get(limit=1)
+            self.course_content.query(query_texts=["warmup"], n_results=1)
+        except Exception as e:
+            # A cold first query is only slower, so startup never fails here
+            print(f"Error warming up vector store: {e}")
     
     def _create_collection(self, name: str):
         """Create or get a ChromaDB collection"""
@@ -62,7 +154,9 @@ class VectorStore:
                query: str,
                course_name: Optional[str] = None,
                lesson_number: Optional[int] = None,
-               limit: Optional[int] = None) -> SearchResults:
+               limit: Optional[int] = None,
+               course_names: Optional[Sequence[str]] = None,
+               lesson_numbers: Optional[Sequence[int]] = None) -> SearchResults:
         """
         Main search interface that handles course resolution and content search.
         
@@ -71,71 +165,250 @@ class VectorStore:
             course_name: Optional course name/title to filter by
             lesson_number: Optional lesson number to filter by
             limit: Maximum results to return
+            course_names: Optional course names matching any of which is allowed
+            lesson_numbers: Optional lesson numbers matching any of which is allowed
             
         Returns:
             SearchResults object with documents and metadata
         """
-        # Step 1: Resolve course name if provided
-        course_title = None
-        if course_name:
-            course_title = self._resolve_course_name(course_name)
-            if not course_title:
-                return SearchResults.empty(f"No course found matching '{course_name}'")
+        # Use provided limit or fall back to configured max_results
+        search_limit = limit if limit is not None else self.max_results
+        
+        course_filter, lesson_filter = self._merge_filters(
+            course_name, lesson_number, course_names, lesson_numbers
+        )
+        
+        # Repeated questions skip embedding and the ANN query entirely
+        filters = (course_filter, lesson_filter, search_limit)
+        cache_key = (query, *filters)
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            return cached.copy()
+        
+        # Near-duplicate queries with the same filters reuse an earlier result
+        query_embedding = None
+        if self._semantic_cache is not None:
+            query_embedding = self.embedding_function([query])[0]
+            similar = self._semantic_cache.lookup(query_embedding, filters)
+            if similar is not None:
+                self._cache.put(cache_key, similar)
+                return similar.copy()
+        
+        # Step 1: Resolve course name(s) if provided
+        course_title, error = self._resolve_course_filter(course_filter)
+        if error is not None:
+            return error
         
         # Step 2: Build filter for content search
-        filter_dict = self._build_filter(course_title, lesson_number)
+        filter_dict = self._build_filter(course_title, lesson_filter)
         
         # Step 3: Search course content
-        # Use provided limit or fall back to configured max_results
-        search_limit = limit if limit is not None else self.max_results
-        
         try:
+            # Pass the embedding when we already have one so the query isn't embedded twice
+            if query_embedding is not None:
+                query_input = {"query_embeddings": [query_embedding]}
+            else:
+                query_input = {"query_texts": [query]}
             results = self.course_content.query(
-                query_texts=[query],
+                **query_input,
                 n_results=search_limit,
                 where=filter_dict
             )
-            return SearchResults.from_chroma(results)
         except Exception as e:
             return SearchResults.empty(f"Search error: {str(e)}")
+        
+        # Only successful searches are cached, so transient errors are retried
+        search_results = SearchResults.from_chroma(results)
+        self._cache.put(cache_key, search_results)
+        if self._semantic_cache is not None:
+            self._semantic_cache.add(query_embedding, filters, search_results)
+        # Cached results are shared, so every caller gets its own copy
+        return search_results.copy()
+    
+    async def asearch(self,
+                      query: str,
+                      course_name: Optional[str] = None,
+                      lesson_number: Optional[int] = None,
+                      limit: Optional[int] = None,
+                      course_names: Optional[Sequence[str]] = None,
+                      lesson_numbers: Optional[Sequence[int]] = None) -> SearchResults:
+        """Async search() that runs the blocking Chroma round-trip in a worker thread"""
+        return await asyncio.to_thread(
+            self.search, query, course_name, lesson_number, limit, course_names, lesson_numbers
+        )
+    
+    def batch_search(self,
+                     queries: List[str],
+                     course_name: Optional[str] = None,
+                     lesson_number: Optional[int] = None,
+                     limit: Optional[int] = None,
+                     course_names: Optional[Sequence[str]] = None,
+                     lesson_numbers: Optional[Sequence[int]] = None) -> List[SearchResults]:
+        """
+        Search several queries under the same filters with a single content query.
+        
+        Args:
+            queries: What to search for, one entry per sub-query
+            course_name: Optional course name/title to filter by
+            lesson_number: Optional lesson number to filter by
+            limit: Maximum results to return per query
+            course_names: Optional course names matching any of which is allowed
+            lesson_numbers: Optional lesson numbers matching any of which is allowed
+            
+        Returns:
+            One SearchResults per query, in the same order
+        """
+        search_limit = limit if limit is not None else self.max_results
+        course_filter, lesson_filter = self._merge_filters(
+            course_name, lesson_number, course_names, lesson_numbers
+        )
+        filters = (course_filter, lesson_filter, search_limit)
+        # Cached results are shared, so every caller gets its own copy
+        results: List[Optional[SearchResults]] = [
+            cached.copy() if cached is not None else None
+            for cached in (self._cache.get((query, *filters)) for query in queries)
+        ]
+        misses = [i for i, cached in enumerate(results) if cached is None]
+        if not misses:
+            return results
+        
+        # Embed all misses in one call and let near-duplicates reuse earlier results
+        embeddings = None
+        if self._semantic_cache is not None:
+            all_embeddings = self.embedding_function([queries[i] for i in misses])
+            embeddings = {}
+            for i, embedding in zip(misses, all_embeddings):
+                similar = self._semantic_cache.lookup(embedding, filters)
+                if similar is not None:
+                    self._cache.put((queries[i], *filters), similar)
+                    results[i] = similar.copy()
+                else:
+                    embeddings[i] = embedding
+            misses = list(embeddings)
+            if not misses:
+                return results
+        
+        course_title, error = self._resolve_course_filter(course_filter)
+        if error is not None:
+            return [result if result is not None else error for result in results]
+        
+        filter_dict = self._build_filter(course_title, lesson_filter)
+        
+        try:
+            if embeddings is not None:
+                query_input = {"query_embeddings": [embeddings[i] for i in misses]}
+            else:
+                query_input = {"query_texts": [queries[i] for i in misses]}
+            chroma_results = self.course_content.query(
+                **query_input,
+                n_results=search_limit,
+                where=filter_dict
+            )
+        except Exception as e:
+            error = SearchResults.empty(f"Search error: {str(e)}")
+            return [result if result is not None else error for result in results]
+        
+        for position, i in enumerate(misses):
+            search_results = SearchResults.from_chroma(chroma_results, position)
+            self._cache.put((queries[i], *filters), search_results)
+            if embeddings is not None:
+                self._semantic_cache.add(embeddings[i], filters, search_results)
+            results[i] = search_results.copy()
+        return results
+    
+    @staticmethod
+    def _merge_filters(course_name: Optional[str],
+                       lesson_number: Optional[int],
+                       course_names: Optional[Sequence[str]],
+                       lesson_numbers: Optional[Sequence[int]]
+                       ) -> Tuple[Union[str, Tuple[str, ...], None], Union[int, Tuple[int, ...], None]]:
+        """Fold plural filters into the singular ones as tuples
+        
+        Tuples keep cache keys hashable and let one query cover several courses or lessons.
+        """
+        course_filter: Union[str, Tuple[str, ...], None] = course_name
+        if course_names:
+            course_filter = tuple(([course_name] if course_name else []) + list(course_names))
+        lesson_filter: Union[int, Tuple[int, ...], None] = lesson_number
+        if lesson_numbers:
+            lesson_filter = tuple(([lesson_number] if lesson_number is not None else []) + list(lesson_numbers))
+        return course_filter, lesson_filter
+    
+    def _resolve_course_filter(self, course_filter: Union[str, Tuple[str, ...], None]
+                               ) -> Tuple[Union[str, List[str], None], Optional[SearchResults]]:
+        """Resolve a course filter to title(s), or return the error result to report"""
+        if isinstance(course_filter, tuple):
+            # Unmatched names are dropped as long as at least one course resolves
+            titles = [title for title in map(self._resolve_course_name, course_filter) if title]
+            if not titles:
+                return None, SearchResults.empty(f"No course found matching any of {', '.join(course_filter)}")
+            return list(dict.fromkeys(titles)), None
+        if course_filter:
+            course_title = self._resolve_course_name(course_filter)
+            if not course_title:
+                return None, SearchResults.empty(f"No course found matching '{course_filter}'")
+            return course_title, None
+        return None, None
+    
+    def _invalidate_caches(self):
+        """Drop cached search results after any write to the collections"""
+        self._cache.invalidate()
+        self._get_lesson_map.cache_clear()
+        self._get_course_title.cache_clear()
+        self._titles_cache = None
+        if self._semantic_cache is not None:
+            self._semantic_cache.invalidate()
     
     def _resolve_course_name(self, course_name: str) -> Optional[str]:
         """Use vector search to find best matching course by name"""
         try:
-            results = self.course_catalog.query(
-                query_texts=[course_name],
-                n_results=1
-            )
-            
-            if results['documents'][0] and results['metadatas'][0]:
-                # Return the title (which is now the ID)
-                return results['metadatas'][0][0]['title']
+            return self._get_course_title(course_name)
         except Exception as e:
+            # Raised errors are never memoized, so the next call retries
             print(f"Error resolving course name: {e}")
         
         return None
     
-    def _build_filter(self, course_title: Optional[str], lesson_number: Optional[int]) -> Optional[Dict]:
-        """Build ChromaDB filter from search parameters"""
+    def _query_course_title(self, course_name: str) -> Optional[str]:
+        """Run the catalog query behind _resolve_course_name"""
+        results = self.course_catalog.query(
+            query_texts=[course_name],
+            n_results=1
+        )
+        
+        if results['documents'][0] and results['metadatas'][0]:
+            # Return the title (which is now the ID)
+            return results['metadatas'][0][0]['title']
+        return None
+    
+    def _build_filter(self,
+                      course_title: Union[str, Sequence[str], None],
+                      lesson_number: Union[int, Sequence[int], None]) -> Optional[Dict]:
+        """Build ChromaDB filter from search parameters; lists match any of their values"""
         if not course_title and lesson_number is None:
             return None
             
         # Handle different filter combinations
         if course_title and lesson_number is not None:
             return {"$and": [
-                {"course_title": course_title},
-                {"lesson_number": lesson_number}
+                self._match("course_title", course_title),
+                self._match("lesson_number", lesson_number)
             ]}
         
         if course_title:
-            return {"course_title": course_title}
+            return self._match("course_title", course_title)
             
-        return {"lesson_number": lesson_number}
+        return self._match("lesson_number", lesson_number)
+    
+    @staticmethod
+    def _match(field_name: str, value) -> Dict:
+        """Equality clause for a single value, $in clause for a list or tuple"""
+        if isinstance(value, (list, tuple)):
+            return {field_name: {"$in": list(value)}}
+        return {field_name: value}
     
     def add_course_metadata(self, course: Course):
         """Add course information to the catalog for semantic search"""
-        import json
-
         course_text = course.title
         
         # Build lessons metadata and serialize as JSON string
@@ -149,21 +422,51 @@ class VectorStore:
         
         self.course_catalog.add(
             documents=[course_text],
+            embeddings=self.embedding_function([course_text]),
             metadatas=[{
                 "title": course.title,
                 "instructor": course.instructor,
                 "course_link": course.course_link,
-                "lessons_json": json.dumps(lessons_metadata),  # Serialize as JSON string
+                "lessons_json": orjson.dumps(lessons_metadata).decode(),  # Serialize as JSON string
                 "lesson_count": len(course.lessons)
             }],
             ids=[course.title]
         )
+        # Invalidate after the write so no search that raced it stays cached
+        self._invalidate_caches()
+    
+    @contextmanager
+    def bulk_ingest(self):
+        """
+        Buffer add_course_content calls and write them together on exit.
+        
+        Many small per-course adds become full add_batch_size batches, so a bulk load
+        runs far fewer Chroma write transactions. Buffered chunks are not searchable
+        until the block exits, and are discarded if the block raises.
+        """
+        if self._pending_chunks is not None:
+            yield self  # Already buffering; the outermost block flushes
+            return
+        
+        self._pending_chunks = []
+        try:
+            yield self
+        except BaseException:
+            # A failed ingest writes nothing, and its exception propagates unchanged
+            self._pending_chunks = None
+            raise
+        pending, self._pending_chunks = self._pending_chunks, None
+        self.add_course_content(pending)
     
     def add_course_content(self, chunks: List[CourseChunk]):
         """Add course content chunks to the vector store"""
         if not chunks:
             return
         
+        if self._pending_chunks is not None:
+            self._pending_chunks.extend(chunks)
+            return
+        
         documents = [chunk.content for chunk in chunks]
         metadatas = [{
             "course_title": chunk.course_title,
@@ -173,11 +476,17 @@ class VectorStore:
         # Use title with chunk index for unique IDs
         ids = [f"{chunk.course_title.replace(' ', '_')}_{chunk.chunk_index}" for chunk in chunks]
         
-        self.course_content.add(
-            documents=documents,
-            metadatas=metadatas,
-            ids=ids
-        )
+        # Bounded batches keep each SQLite transaction small; each batch is embedded
+        # in one call rather than leaving it to Chroma
+        for start in range(0, len(chunks), self.add_batch_size):
+            end = start + self.add_batch_size
+            self.course_content.add(
+                documents=documents[start:end],
+                embeddings=self.embedding_function(documents[start:end]),
+                metadatas=metadatas[start:end],
+                ids=ids[start:end]
+            )
+        self._invalidate_caches()
     
     def clear_all_data(self):
         """Clear all data from both collections"""
@@ -189,15 +498,21 @@ class VectorStore:
             self.course_content = self._create_collection("course_content")
         except Exception as e:
             print(f"Error clearing data: {e}")
+        self._invalidate_caches()
+    
+    def _load_titles(self) -> List[str]:
+        """Catalog ids (course titles), fetched once until the next write"""
+        if self._titles_cache is None:
+            # Only the ids are needed, so skip loading documents and metadata
+            results = self.course_catalog.get(include=[])
+            self._titles_cache = list(results['ids']) if results and 'ids' in results else []
+        return self._titles_cache
     
     def get_existing_course_titles(self) -> List[str]:
         """Get all existing course titles from the vector store"""
         try:
-            # Get all documents from the catalog
-            results = self.course_catalog.get()
-            if results and 'ids' in results:
-                return results['ids']
-            return []
+            # Return a copy so callers can't mutate the cached list
+            return list(self._load_titles())
         except Exception as e:
             print(f"Error getting existing course titles: {e}")
             return []
@@ -205,17 +520,13 @@ class VectorStore:
     def get_course_count(self) -> int:
         """Get the total number of courses in the vector store"""
         try:
-            results = self.course_catalog.get()
-            if results and 'ids' in results:
-                return len(results['ids'])
-            return 0
+            return len(self._load_titles())
         except Exception as e:
             print(f"Error getting course count: {e}")
             return 0
     
     def get_all_courses_metadata(self) -> List[Dict[str, Any]]:
         """Get metadata for all courses in the vector store"""
-        import json
         try:
             results = self.course_catalog.get()
             if results and 'metadatas' in results:
@@ -224,7 +535,7 @@ class VectorStore:
                 for metadata in results['metadatas']:
                     course_meta = metadata.copy()
                     if 'lessons_json' in course_meta:
-                        course_meta['lessons'] = json.loads(course_meta['lessons_json'])
+                        course_meta['lessons'] = orjson.loads(course_meta['lessons_json'])
                         del course_meta['lessons_json']  # Remove the JSON string version
                     parsed_metadata.append(course_meta)
                 return parsed_metadata
@@ -248,20 +559,21 @@ class VectorStore:
     
     def get_lesson_link(self, course_title: str, lesson_number: int) -> Optional[str]:
         """Get lesson link for a given course title and lesson number"""
-        import json
         try:
-            # Get course by ID (title is the ID)
-            results = self.course_catalog.get(ids=[course_title])
-            if results and 'metadatas' in results and results['metadatas']:
-                metadata = results['metadatas'][0]
-                lessons_json = metadata.get('lessons_json')
-                if lessons_json:
-                    lessons = json.loads(lessons_json)
-                    # Find the lesson with matching number
-                    for lesson in lessons:
-                        if lesson.get('lesson_number') == lesson_number:
-                            return lesson.get('lesson_link')
-            return None
+            return self._get_lesson_map(course_title).get(lesson_number)
         except Exception as e:
             print(f"Error getting lesson link: {e}")
+    
+    def _load_lesson_map(self, course_title: str) -> Dict[int, Optional[str]]:
+        """Fetch a course's lessons_json once and index its links by lesson number"""
+        # Get course by ID (title is the ID)
+        results = self.course_catalog.get(ids=[course_title])
+        if results and 'metadatas' in results and results['metadatas']:
+            lessons_json = results['metadatas'][0].get('lessons_json')
+            if lessons_json:
+                return {
+                    lesson.get('lesson_number'): lesson.get('lesson_link')
+                    for lesson in orjson.loads(lessons_json)
+                }
+        return {}
     
\ No newline at end of file
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+In-process runner for black, isort, flake8, and mypy.
+Called by format.py so several tools share one interpreter startup.
+
+Usage: _run_checks.py [--only black,isort] PATH...
+"""
+
+import argparse
+import sys
+
+
+def run_black(paths: list[str]) -> int:
+    """Format paths with black."""
+    import black
+    import click
+
+    try:
+        return black.main(paths, standalone_mode=False) or 0
+    except click.ClickException as e:
+        # Usage errors (e.g. a missing path) are reported, not raised, as the CLI does
+        e.show()
+        return e.exit_code
+
+
+def run_isort(paths: list[str]) -> int:
+    """Sort imports in paths with isort."""
+    import isort.main
+
+    try:
+        isort.main.main(paths)
+    except SystemExit as e:
+        return e.code if isinstance(e.code, int) else 1
+    return 0
+
+
+def run_flake8(paths: list[str]) -> int:
+    """Lint paths with flake8."""
+    from flake8.main.application import Application
+
+    app = Application()
+    app.run(paths)
+    return app.exit_code()
+
+
+def run_mypy(paths: list[str]) -> int:
+    """Type check paths with mypy."""
+    import mypy.api
+
+    stdout, stderr, exit_status = mypy.api.run(paths)
+    if stdout:
+        print(stdout, end="")
+    if stderr:
+        print(stderr, end="", file=sys.stderr)
+    return exit_status
+
+
+# Tool name -> (description, runner); formatters rewrite files, so they come first
+CHECKS = {
+    "black": ("Black formatting", run_black),
+    "isort": ("Import sorting", run_isort),
+    "flake8": ("Flake8 linting", run_flake8),
+    "mypy": ("MyPy type checking", run_mypy),
+}
+
+
+def run_checks(paths: list[str], names: list[str]) -> dict[str, int]:
+    """Run the named tools in CHECKS order and return each one's exit code by description."""
+    return_codes = {}
+    for name, (description, check) in CHECKS.items():
+        if name not in names:
+            continue
+        print(f"Running {description}...", flush=True)
+        try:
+            return_codes[description] = check(paths)
+        except Exception as e:
+            print(f"{description} crashed: {e}", file=sys.stderr)
+            return_codes[description] = 1
+        sys.stdout.flush()
+    return return_codes
+
+
+def main(argv: list[str]) -> int:
+    """Run the selected tools (all by default) and report each one's result."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--only", help="comma-separated tools to run: " + ",".join(CHECKS))
+    parser.add_argument("paths", nargs="+")
+    args = parser.parse_args(argv)
+
+    names = args.only.split(",") if args.only else list(CHECKS)
+    unknown = [name for name in names if name not in CHECKS]
+    if unknown:
+        parser.error(f"unknown tool(s): {', '.join(unknown)}")
+
+    return_codes = run_checks(args.paths, names)
+
+    print()
+    for description, code in return_codes.items():
+        print(f"{'✅' if code == 0 else '❌'} {description} {'passed' if code == 0 else 'failed'}")
+    return 0 if all(code == 0 for code in return_codes.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -4,27 +4,41 @@ Code formatting and quality check script.
 Run all code quality tools: black, isort, flake8, and mypy.
 """
 
+import io
 import subprocess
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Optional, TextIO
 
+_print_lock = threading.Lock()
 
-def run_command(command: list[str], description: str) -> bool:
-    """Run a command and return True if successful."""
-    print(f"Running {description}...")
-    try:
-        result = subprocess.run(command, check=True, capture_output=True, text=True)
-        if result.stdout:
-            print(result.stdout)
-        print(f"✅ {description} passed")
+
+def run_command(command: list[str], description: str, out: Optional[TextIO] = None) -> bool:
+    """Run a command, streaming its output as it arrives, and return True if successful."""
+    out = out if out is not None else sys.stdout
+    print(f"Running {description}...", file=out, flush=True)
+    with subprocess.Popen(
+        command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1
+    ) as proc:
+        for line in iter(proc.stdout.readline, ""):
+            print(line, end="", file=out, flush=True)
+        returncode = proc.wait()
+    if returncode == 0:
+        print(f"✅ {description} passed", file=out)
         return True
-    except subprocess.CalledProcessError as e:
-        print(f"❌ {description} failed")
-        if e.stdout:
-            print(e.stdout)
-        if e.stderr:
-            print(e.stderr)
-        return False
+    print(f"❌ {description} failed", file=out)
+    return False
+
+
+def run_command_buffered(command: list[str], description: str) -> bool:
+    """Run a command into its own buffer and print the whole report once it finishes."""
+    report = io.StringIO()
+    passed = run_command(command, description, out=report)
+    with _print_lock:
+        print(report.getvalue(), end="", flush=True)
+    return passed
 
 
 def main():
@@ -40,29 +54,23 @@ def main():
     
     all_passed = True
     
-    # Format with black
-    all_passed &= run_command(
-        ["uv", "run", "black"] + paths,
-        "Black formatting"
-    )
-    
-    # Sort imports with isort
+    # Black and isort rewrite files, so they run one after the other first, sharing
+    # one uv/Python startup in the in-process runner, which reports each tool's result
+    runner = Path(__file__).parent / "_run_checks.py"
     all_passed &= run_command(
-        ["uv", "run", "isort"] + paths,
-        "Import sorting"
+        ["uv", "run", "python", str(runner), "--only", "black,isort"] + paths,
+        "Formatting (black, isort)"
     )
     
-    # Lint with flake8
-    all_passed &= run_command(
-        ["uv", "run", "flake8"] + paths,
-        "Flake8 linting"
-    )
-    
-    # Type check with mypy
-    all_passed &= run_command(
-        ["uv", "run", "mypy"] + paths,
-        "MyPy type checking"
-    )
+    # Lint with flake8 and type check with mypy; both only read files, so they run
+    # concurrently and each report is printed whole as soon as its tool finishes
+    checks = [
+        (["uv", "run", "flake8"] + paths, "Flake8 linting"),
+        (["uv", "run", "mypy"] + paths, "MyPy type checking"),
+    ]
+    with ThreadPoolExecutor(max_workers=len(checks)) as executor:
+        futures = [executor.submit(run_command_buffered, cmd, desc) for cmd, desc in checks]
+        all_passed &= all(f.result() for f in futures)
     
     if all_passed:
         print("\n🎉 All code quality checks passed!")